@@ -0,0 +1,168 @@
+"""Vencimento dos álbuns em lote: recálculo com um UPDATE só e varredura diária dos vencidos"""
+import asyncio
+import logging
+import os
+import time
+from datetime import date, datetime
+from typing import Any, Dict, Optional
+
+from sqlalchemy import case, update
+from sqlalchemy.ext.compiler import compiles
+from sqlalchemy.orm import Session
+from sqlalchemy.sql.expression import ColumnElement
+from sqlalchemy.types import Date
+from starlette.concurrency import run_in_threadpool
+
+from database import SessionLocal, Album
+from config_snapshot import config_store
+from dashboard_counters import bump_counters, reconcile_counters
+
+logger = logging.getLogger(__name__)
+
+ALBUM_EXPIRY_SWEEP_ENABLED = os.environ.get('ALBUM_EXPIRY_SWEEP_ENABLED', 'true').lower() == 'true'
+ALBUM_EXPIRY_SWEEP_INTERVAL_SECONDS = int(os.environ.get('ALBUM_EXPIRY_SWEEP_INTERVAL_SECONDS', 24 * 3600))
+ALBUM_EXPIRY_SWEEP_BATCH_SIZE = int(os.environ.get('ALBUM_EXPIRY_SWEEP_BATCH_SIZE', 500))
+
+# Só estes status mudam com o vencimento; 'disabled' é decisão do admin e fica como está
+EXPIRY_STATUSES = ('active', 'expired')
+
+class date_plus_days(ColumnElement):
+    """Data + N dias, no SQL de cada banco"""
+    type = Date()
+    inherit_cache = False  # `days` vai literal no SQL: sem cache de compilação
+
+    def __init__(self, date_expr, days: int):
+        self.date_expr = date_expr
+        self.days = int(days)
+
+@compiles(date_plus_days)
+def _compile_date_plus_days(element, compiler, **kw):
+    return f"DATE_ADD({compiler.process(element.date_expr, **kw)}, INTERVAL {element.days} DAY)"
+
+@compiles(date_plus_days, 'sqlite')
+def _compile_date_plus_days_sqlite(element, compiler, **kw):
+    return f"DATE({compiler.process(element.date_expr, **kw)}, '+{element.days} days')"
+
+def recompute_all_album_expiry(db: Session, expiry_days: Optional[int]) -> Dict[str, Any]:
+    """Recalcula expires_at e status de todos os álbuns com data de evento, num único UPDATE"""
+    started = time.perf_counter()
+    if not expiry_days:
+        return {'updated': 0, 'duration_ms': 0.0}
+
+    today = date.today()
+    new_expires_at = date_plus_days(Album.event_date, expiry_days)
+    # O status usa a expressão, não a coluna: o MySQL aplica as atribuições da esquerda para a direita
+    result = db.execute(
+        update(Album)
+        .where(Album.event_date != None, Album.status.in_(EXPIRY_STATUSES))
+        .values(
+            expires_at=new_expires_at,
+            status=case((new_expires_at < today, 'expired'), else_='active'),
+            updated_at=datetime.utcnow()
+        )
+        .execution_options(synchronize_session=False)
+    )
+    db.commit()
+
+    # Muitos álbuns podem ter trocado de status: recontar é mais simples que somar deltas
+    reconcile_counters(db)
+
+    return {'updated': result.rowcount, 'duration_ms': round((time.perf_counter() - started) * 1000, 1)}
+
+def expire_overdue_albums(db: Session, batch_size: int = ALBUM_EXPIRY_SWEEP_BATCH_SIZE) -> Dict[str, Any]:
+    """Marca como vencidos os álbuns ativos com expires_at no passado, em lotes curtos
+
+    Cada lote é uma transação pequena (UPDATE ... LIMIT no MariaDB), para não segurar
+    bloqueios na tabela de álbuns enquanto os convidados enviam fotos.
+    """
+    started = time.perf_counter()
+    today = date.today()
+    statement = (
+        update(Album)
+        .where(Album.status == 'active', Album.expires_at != None, Album.expires_at < today)
+        .values(status='expired', updated_at=datetime.utcnow())
+        .with_dialect_options(mysql_limit=batch_size)
+        .execution_options(synchronize_session=False)
+    )
+
+    updated = batches = 0
+    while True:
+        changed = db.execute(statement).rowcount
+        if changed:
+            bump_counters(db, active_albums=-changed, expired_albums=changed)
+        db.commit()
+        if not changed:
+            break
+        updated += changed
+        batches += 1
+        if changed < batch_size:
+            break
+
+    return {
+        'updated': updated,
+        'batches': batches,
+        'duration_ms': round((time.perf_counter() - started) * 1000, 1)
+    }
+
+class AlbumExpirySweeper:
+    """Roda a varredura de vencidos ao iniciar e depois a cada ALBUM_EXPIRY_SWEEP_INTERVAL_SECONDS"""
+
+    def __init__(self):
+        self._task: Optional[asyncio.Task] = None
+        self.metrics: Dict[str, Any] = {
+            'sweeps': 0,
+            'expired': 0,
+            'last_sweep_at': None,
+            'last_sweep': None,
+            'last_recompute_at': None,
+            'last_recompute': None,
+            'last_error': None
+        }
+
+    def sweep(self) -> Dict[str, Any]:
+        """Executa uma varredura (bloqueante)"""
+        db = SessionLocal()
+        try:
+            result = expire_overdue_albums(db)
+        finally:
+            db.close()
+
+        self.metrics['sweeps'] += 1
+        self.metrics['expired'] += result['updated']
+        self.metrics['last_sweep_at'] = datetime.utcnow().isoformat()
+        self.metrics['last_sweep'] = result
+        return result
+
+    def recompute(self, db: Session, expiry_days: Optional[int] = None) -> Dict[str, Any]:
+        """Recalcula todos os vencimentos (usado quando o admin muda album_expiry_days)"""
+        if expiry_days is None:
+            settings = config_store.current().settings
+            expiry_days = settings.album_expiry_days if settings else None
+
+        result = recompute_all_album_expiry(db, expiry_days)
+        self.metrics['last_recompute_at'] = datetime.utcnow().isoformat()
+        self.metrics['last_recompute'] = result
+        logger.info(f"Vencimento dos álbuns recalculado: {result}")
+        return result
+
+    async def start(self):
+        if ALBUM_EXPIRY_SWEEP_ENABLED and self._task is None:
+            self._task = asyncio.create_task(self._loop())
+
+    async def stop(self):
+        if self._task:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+
+    async def _loop(self):
+        while True:
+            try:
+                result = await run_in_threadpool(self.sweep)
+                logger.info(f"Varredura de álbuns vencidos: {result}")
+            except Exception as error:
+                self.metrics['last_error'] = str(error)
+                logger.exception("Erro na varredura de álbuns vencidos")
+            await asyncio.sleep(ALBUM_EXPIRY_SWEEP_INTERVAL_SECONDS)
+
+album_expiry_sweeper = AlbumExpirySweeper()
@@ -0,0 +1,85 @@
+#!/usr/bin/env python3
+"""
+Preenche content_hash dos uploads antigos, para que reenvios do mesmo arquivo sejam deduplicados
+
+Usa o SHA-256 informado pelo Drive quando existe; senão baixa o arquivo em blocos,
+calculando o hash sem gravar em disco. Uploads recomprimidos são ignorados: o
+arquivo no Drive não é o original enviado pelo convidado.
+
+Uso (dentro de backend/):
+    python backfill_content_hashes.py [--album ALBUM_ID] [--limit N] [--dry-run]
+"""
+
+import argparse
+import hashlib
+
+from database import SessionLocal, Upload
+from google_drive_service import GoogleDriveService
+
+class HashingSink:
+    """Destino de download que só acumula o SHA-256 do conteúdo"""
+
+    def __init__(self):
+        self.digest = hashlib.sha256()
+
+    def write(self, data: bytes) -> int:
+        self.digest.update(data)
+        return len(data)
+
+    def hexdigest(self) -> str:
+        return self.digest.hexdigest()
+
+def content_hash_from_drive(drive_service: GoogleDriveService, upload: Upload) -> str:
+    checksum = drive_service.get_file_sha256(upload.album.client_id, upload.google_file_id)
+    if checksum:
+        return checksum.lower()
+
+    sink = HashingSink()
+    drive_service.download_file(upload.album.client_id, upload.google_file_id, sink)
+    return sink.hexdigest()
+
+def backfill(album_id: str = None, limit: int = None, dry_run: bool = False):
+    db = SessionLocal()
+    try:
+        query = db.query(Upload).filter(
+            Upload.content_hash == None,
+            Upload.status == 'stored',
+            Upload.google_file_id != None,
+            (Upload.original_size_bytes == None) | (Upload.original_size_bytes == Upload.size_bytes)
+        ).order_by(Upload.uploaded_at)
+        if album_id:
+            query = query.filter(Upload.album_id == album_id)
+        if limit:
+            query = query.limit(limit)
+
+        uploads = query.all()
+        print(f"🔎 {len(uploads)} uploads sem hash de conteúdo")
+
+        drive_service = GoogleDriveService(db)
+        updated = failed = 0
+        for upload in uploads:
+            try:
+                content_hash = content_hash_from_drive(drive_service, upload)
+            except Exception as e:
+                failed += 1
+                print(f"⚠️  {upload.id} ({upload.filename}): {e}")
+                continue
+
+            print(f"✅ {upload.id} ({upload.filename}): {content_hash[:12]}…")
+            if not dry_run:
+                upload.content_hash = content_hash
+                db.commit()
+            updated += 1
+
+        print(f"🎉 Concluído: {updated} atualizados, {failed} com erro{' (simulação)' if dry_run else ''}")
+    finally:
+        db.close()
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Preenche o hash de conteúdo dos uploads existentes")
+    parser.add_argument('--album', help="Processar só este álbum")
+    parser.add_argument('--limit', type=int, help="Máximo de uploads nesta execução")
+    parser.add_argument('--dry-run', action='store_true', help="Calcula os hashes sem gravar no banco")
+    args = parser.parse_args()
+
+    backfill(args.album, args.limit, args.dry_run)
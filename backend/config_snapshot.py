@@ -0,0 +1,151 @@
+"""Retrato imutável da configuração (Google Cloud API e sistema), lido sem acessar o banco"""
+import asyncio
+import logging
+import os
+import threading
+import time
+from dataclasses import dataclass
+from datetime import datetime
+from typing import Optional
+
+from sqlalchemy.orm import Session
+from starlette.concurrency import run_in_threadpool
+
+from database import SessionLocal, GoogleConfig, SystemSettings, ConfigVersion
+
+logger = logging.getLogger(__name__)
+
+# Atraso máximo até um processo enxergar a configuração salva por outro
+CONFIG_POLL_INTERVAL_SECONDS = float(os.environ.get('CONFIG_POLL_INTERVAL_SECONDS', 5))
+
+CONFIG_VERSION_ROW_ID = 'global'
+
+@dataclass(frozen=True)
+class GoogleConfigSnapshot:
+    id: str
+    client_id: str
+    client_secret: str
+    redirect_uri: str
+    scopes: Optional[str]
+
+@dataclass(frozen=True)
+class SystemSettingsSnapshot:
+    id: str
+    album_expiry_days: Optional[int]
+    site_name: Optional[str]
+    site_description: Optional[str]
+
+@dataclass(frozen=True)
+class ConfigSnapshot:
+    version: int
+    google: Optional[GoogleConfigSnapshot]
+    settings: Optional[SystemSettingsSnapshot]
+    loaded_at: float
+
+def bump_config_version(db: Session):
+    """Marca a configuração como alterada, dentro da transação de quem salvou"""
+    updated = db.query(ConfigVersion).filter(ConfigVersion.id == CONFIG_VERSION_ROW_ID).update(
+        {'version': ConfigVersion.version + 1, 'updated_at': datetime.utcnow()},
+        synchronize_session=False
+    )
+    if not updated:
+        db.add(ConfigVersion(id=CONFIG_VERSION_ROW_ID, version=1))
+
+def read_config_version(db: Session) -> int:
+    row = db.query(ConfigVersion.version).filter(ConfigVersion.id == CONFIG_VERSION_ROW_ID).first()
+    return row.version if row else 0
+
+def load_snapshot(db: Session) -> ConfigSnapshot:
+    # Versão lida antes das linhas: uma alteração concorrente só pode causar um recarregamento a mais
+    version = read_config_version(db)
+    google = db.query(GoogleConfig).filter(GoogleConfig.is_active == True).first()
+    settings = db.query(SystemSettings).filter(SystemSettings.is_active == True).first()
+
+    return ConfigSnapshot(
+        version=version,
+        google=GoogleConfigSnapshot(
+            id=google.id,
+            client_id=google.client_id,
+            client_secret=google.client_secret,
+            redirect_uri=google.redirect_uri,
+            scopes=google.scopes
+        ) if google else None,
+        settings=SystemSettingsSnapshot(
+            id=settings.id,
+            album_expiry_days=settings.album_expiry_days,
+            site_name=settings.site_name,
+            site_description=settings.site_description
+        ) if settings else None,
+        loaded_at=time.monotonic()
+    )
+
+class ConfigStore:
+    """Guarda o retrato atual e o recarrega quando a linha de versão muda"""
+
+    def __init__(self, poll_interval: float = CONFIG_POLL_INTERVAL_SECONDS):
+        self.poll_interval = poll_interval
+        self._snapshot: Optional[ConfigSnapshot] = None
+        self._lock = threading.Lock()
+        self._task: Optional[asyncio.Task] = None
+
+    def current(self) -> ConfigSnapshot:
+        """Retrato atual; só acessa o banco na primeira chamada do processo"""
+        snapshot = self._snapshot
+        if snapshot is None:
+            with self._lock:
+                if self._snapshot is None:
+                    self._reload()
+                snapshot = self._snapshot
+        return snapshot
+
+    def _reload(self):
+        db = SessionLocal()
+        try:
+            self._snapshot = load_snapshot(db)
+        finally:
+            db.close()
+
+    def reload(self):
+        """Recarrega já (usado por quem acabou de salvar a configuração neste processo)"""
+        with self._lock:
+            self._reload()
+
+    def refresh_if_changed(self) -> bool:
+        """Consulta só a versão e recarrega se outro processo salvou algo (bloqueante)"""
+        db = SessionLocal()
+        try:
+            version = read_config_version(db)
+        finally:
+            db.close()
+
+        snapshot = self._snapshot
+        if snapshot is not None and snapshot.version == version:
+            return False
+        self.reload()
+        return True
+
+    async def start(self):
+        try:
+            await run_in_threadpool(self.reload)
+        except Exception:
+            # Sem banco no startup: o primeiro current() ou o poller tentam de novo
+            logger.exception("Erro ao carregar a configuração")
+        if self._task is None:
+            self._task = asyncio.create_task(self._loop())
+
+    async def stop(self):
+        if self._task:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+
+    async def _loop(self):
+        while True:
+            await asyncio.sleep(self.poll_interval)
+            try:
+                if await run_in_threadpool(self.refresh_if_changed):
+                    logger.info(f"Configuração recarregada (versão {self._snapshot.version})")
+            except Exception:
+                logger.exception("Erro ao verificar a versão da configuração")
+
+config_store = ConfigStore()
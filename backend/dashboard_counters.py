@@ -0,0 +1,119 @@
+"""Contadores materializados do dashboard administrativo e reconciliação periódica"""
+import asyncio
+import logging
+import os
+from datetime import datetime
+from typing import Optional
+
+from sqlalchemy import func, select
+from sqlalchemy.orm import Session
+from starlette.concurrency import run_in_threadpool
+
+from database import SessionLocal, Client, Album, Upload, DashboardCounters
+
+logger = logging.getLogger(__name__)
+
+DASHBOARD_RECONCILE_INTERVAL_SECONDS = int(os.environ.get('DASHBOARD_RECONCILE_INTERVAL_SECONDS', 900))
+
+COUNTERS_ROW_ID = 'global'
+
+# Status de cliente que ainda aguardam o pagamento ser aprovado
+PENDING_PAYMENT_STATUSES = ('pending_payment', 'payment_sent')
+
+# Contador de álbuns afetado por cada status
+ALBUM_STATUS_COUNTERS = {'active': 'active_albums', 'expired': 'expired_albums'}
+
+def bump_counters(db: Session, **deltas: int):
+    """Soma os deltas na linha de contadores, dentro da transação de quem chama
+
+    O UPDATE é relativo (coluna = coluna + delta), então transações simultâneas não se
+    sobrescrevem; o commit fica a cargo de quem chamou.
+    """
+    values = {name: getattr(DashboardCounters, name) + delta for name, delta in deltas.items() if delta}
+    if not values:
+        return
+    values['updated_at'] = datetime.utcnow()
+    db.query(DashboardCounters).filter(DashboardCounters.id == COUNTERS_ROW_ID).update(
+        values, synchronize_session=False
+    )
+
+def bump_album_status(db: Session, old_status: Optional[str], new_status: Optional[str]):
+    """Ajusta os contadores de álbuns quando um álbum é criado (old_status None) ou muda de status"""
+    if old_status == new_status:
+        return
+    deltas = {}
+    if old_status in ALBUM_STATUS_COUNTERS:
+        deltas[ALBUM_STATUS_COUNTERS[old_status]] = -1
+    if new_status in ALBUM_STATUS_COUNTERS:
+        deltas[ALBUM_STATUS_COUNTERS[new_status]] = deltas.get(ALBUM_STATUS_COUNTERS[new_status], 0) + 1
+    bump_counters(db, **deltas)
+
+def bump_stored_uploads(db: Session, count: int, size_bytes: int):
+    bump_counters(db, total_uploads=count, total_bytes=size_bytes or 0)
+
+def reconcile_counters(db: Session):
+    """Recalcula todos os contadores a partir das tabelas (corrige qualquer divergência)
+
+    Um único UPDATE com subconsultas, para não sobrescrever incrementos feitos entre
+    uma leitura e a escrita.
+    """
+    now = datetime.utcnow()
+    if not db.query(DashboardCounters.id).filter(DashboardCounters.id == COUNTERS_ROW_ID).first():
+        db.add(DashboardCounters(id=COUNTERS_ROW_ID))
+        db.flush()
+
+    stored_uploads = select(Upload.id, Upload.size_bytes).where(Upload.status == 'stored').subquery()
+    db.query(DashboardCounters).filter(DashboardCounters.id == COUNTERS_ROW_ID).update({
+        'total_clients': select(func.count()).select_from(Client).scalar_subquery(),
+        'pending_payments': select(func.count()).select_from(Client).where(
+            Client.status.in_(PENDING_PAYMENT_STATUSES)
+        ).scalar_subquery(),
+        'active_albums': select(func.count()).select_from(Album).where(Album.status == 'active').scalar_subquery(),
+        'expired_albums': select(func.count()).select_from(Album).where(Album.status == 'expired').scalar_subquery(),
+        'total_uploads': select(func.count()).select_from(stored_uploads).scalar_subquery(),
+        'total_bytes': select(func.coalesce(func.sum(stored_uploads.c.size_bytes), 0)).scalar_subquery(),
+        'updated_at': now,
+        'reconciled_at': now
+    }, synchronize_session=False)
+    db.commit()
+
+def read_counters(db: Session) -> DashboardCounters:
+    """Linha de contadores (criada e preenchida na primeira leitura se não existir)"""
+    counters = db.query(DashboardCounters).filter(DashboardCounters.id == COUNTERS_ROW_ID).first()
+    if counters is None:
+        reconcile_counters(db)
+        counters = db.query(DashboardCounters).filter(DashboardCounters.id == COUNTERS_ROW_ID).first()
+    return counters
+
+class CounterReconciler:
+    """Reconcilia os contadores ao iniciar e depois a cada DASHBOARD_RECONCILE_INTERVAL_SECONDS"""
+
+    def __init__(self):
+        self._task: Optional[asyncio.Task] = None
+
+    def run_once(self):
+        db = SessionLocal()
+        try:
+            reconcile_counters(db)
+        finally:
+            db.close()
+
+    async def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self._loop())
+
+    async def stop(self):
+        if self._task:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+
+    async def _loop(self):
+        while True:
+            try:
+                await run_in_threadpool(self.run_once)
+            except Exception:
+                logger.exception("Erro ao reconciliar contadores do dashboard")
+            await asyncio.sleep(DASHBOARD_RECONCILE_INTERVAL_SECONDS)
+
+counter_reconciler = CounterReconciler()
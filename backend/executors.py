@@ -0,0 +1,32 @@
+"""Pools de threads para tirar do event loop o trabalho bloqueante (Drive e banco)"""
+import asyncio
+import functools
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+import anyio.to_thread
+
+# Uploads e chamadas ao Google Drive (httplib2 bloqueante) ficam num pool próprio e
+# limitado, para que transferências lentas não consumam as threads das rotas de banco
+DRIVE_EXECUTOR_WORKERS = int(os.environ.get('DRIVE_EXECUTOR_WORKERS', 8))
+
+# Threads usadas pelo FastAPI para rotas síncronas (def) e dependências como get_db
+DB_THREADPOOL_SIZE = int(os.environ.get('DB_THREADPOOL_SIZE', 40))
+
+drive_executor = ThreadPoolExecutor(
+    max_workers=DRIVE_EXECUTOR_WORKERS,
+    thread_name_prefix='drive'
+)
+
+async def run_in_drive_pool(func, *args, **kwargs):
+    """Executa uma chamada bloqueante ao Drive no pool dedicado"""
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(drive_executor, functools.partial(func, *args, **kwargs))
+
+def configure_threadpool():
+    """Ajusta o tamanho do pool de threads do AnyIO (precisa rodar dentro do event loop)"""
+    anyio.to_thread.current_default_thread_limiter().total_tokens = DB_THREADPOOL_SIZE
+
+def shutdown_executors():
+    """Aguarda os uploads em andamento e encerra o pool do Drive"""
+    drive_executor.shutdown(wait=True)
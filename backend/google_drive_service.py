@@ -1,17 +1,192 @@
 from google.oauth2.credentials import Credentials
 from google_auth_oauthlib.flow import Flow
-from googleapiclient.discovery import build
-from googleapiclient.http import MediaIoBaseUpload
+from googleapiclient.discovery import build, build_from_document
+from googleapiclient.discovery_cache import get_static_doc
+from googleapiclient.http import MediaIoBaseUpload, MediaIoBaseDownload
 from googleapiclient.errors import HttpError
-from google.auth.transport.requests import Request
+from google.auth.transport.requests import Request, AuthorizedSession
+from google.auth.exceptions import RefreshError
 from sqlalchemy.orm import Session
-from database import GoogleConfig, GoogleToken, get_db
+from sqlalchemy import or_
+from database import GoogleToken, Album, SessionLocal, get_db
+from config_snapshot import config_store, GoogleConfigSnapshot
 import uuid
 import json
 from datetime import datetime, timedelta
 import os
+import threading
+import time
+from collections import OrderedDict
 from io import BytesIO
-from typing import Optional, Dict, Any
+from typing import Optional, Dict, Any, Union, BinaryIO, Callable
+import google_auth_httplib2
+import httplib2
+
+# A API do Drive exige que cada bloco de um upload resumível seja múltiplo de 256 KB
+DRIVE_CHUNK_ALIGNMENT = 256 * 1024
+
+# Tamanho de cada bloco enviado ao Drive: é o máximo de memória que um upload ocupa
+DRIVE_UPLOAD_CHUNK_SIZE = max(
+    DRIVE_CHUNK_ALIGNMENT,
+    int(os.environ.get('DRIVE_UPLOAD_CHUNK_SIZE', 8 * 1024 * 1024)) // DRIVE_CHUNK_ALIGNMENT * DRIVE_CHUNK_ALIGNMENT
+)
+
+# Endpoint de upload resumível do Drive, usado para sessões abertas pelo backend e enviadas pelo navegador
+DRIVE_RESUMABLE_UPLOAD_URL = 'https://www.googleapis.com/upload/drive/v3/files?uploadType=resumable&fields=id,name,size,mimeType'
+
+# Timeout das conexões HTTP com o Drive (segundos)
+DRIVE_HTTP_TIMEOUT = int(os.environ.get('DRIVE_HTTP_TIMEOUT', 120))
+
+# Quantidade de clientes do Drive mantidos em cache por thread
+DRIVE_CLIENT_CACHE_SIZE = int(os.environ.get('DRIVE_CLIENT_CACHE_SIZE', 64))
+
+# Documento de discovery do Drive v3, lido do pacote uma única vez por processo
+_drive_discovery_document: Optional[Dict[str, Any]] = None
+
+# httplib2.Http não é thread-safe: cada thread guarda seus clientes (com conexão keep-alive)
+# e a geração por cliente invalida de uma vez as entradas de todas as threads
+_drive_client_local = threading.local()
+_drive_client_generations: Dict[str, int] = {}
+_drive_client_generations_lock = threading.Lock()
+
+def _get_drive_discovery_document() -> Dict[str, Any]:
+    global _drive_discovery_document
+    if _drive_discovery_document is None:
+        _drive_discovery_document = json.loads(get_static_doc('drive', 'v3'))
+    return _drive_discovery_document
+
+def get_drive_client(client_id: str, credentials: Credentials):
+    """Retorna o cliente do Drive do cliente, reutilizando transporte e discovery já montados"""
+    cache = getattr(_drive_client_local, 'clients', None)
+    if cache is None:
+        cache = _drive_client_local.clients = OrderedDict()
+    
+    generation = _drive_client_generations.get(client_id, 0)
+    entry = cache.get(client_id)
+    if entry and entry['generation'] == generation and entry['token'] == credentials.token:
+        cache.move_to_end(client_id)
+        return entry['service']
+    
+    authorized_http = google_auth_httplib2.AuthorizedHttp(
+        transport_credentials(client_id, credentials),
+        http=httplib2.Http(timeout=DRIVE_HTTP_TIMEOUT)
+    )
+    service = build_from_document(_get_drive_discovery_document(), http=authorized_http)
+    
+    cache[client_id] = {'generation': generation, 'token': credentials.token, 'service': service}
+    cache.move_to_end(client_id)
+    while len(cache) > DRIVE_CLIENT_CACHE_SIZE:
+        cache.popitem(last=False)
+    
+    return service
+
+def invalidate_drive_client(client_id: str):
+    """Descarta os clientes em cache do cliente (token rotacionado ou desconectado)"""
+    with _drive_client_generations_lock:
+        _drive_client_generations[client_id] = _drive_client_generations.get(client_id, 0) + 1
+
+# Tempo máximo que credenciais ficam em cache antes de reler o banco (segundos)
+CREDENTIALS_CACHE_TTL = int(os.environ.get('CREDENTIALS_CACHE_TTL', 300))
+
+_credentials_cache: Dict[str, Dict[str, Any]] = {}
+_credentials_locks: Dict[str, threading.Lock] = {}
+_credentials_locks_guard = threading.Lock()
+
+def _get_credentials_lock(client_id: str) -> threading.Lock:
+    with _credentials_locks_guard:
+        return _credentials_locks.setdefault(client_id, threading.Lock())
+
+def _get_cached_credentials(client_id: str) -> Optional[Credentials]:
+    entry = _credentials_cache.get(client_id)
+    if not entry:
+        return None
+    if time.monotonic() - entry['loaded_at'] > CREDENTIALS_CACHE_TTL or not entry['credentials'].valid:
+        return None
+    return entry['credentials']
+
+def _cache_credentials(client_id: str, credentials: Optional[Credentials]):
+    if credentials:
+        _credentials_cache[client_id] = {
+            'credentials': credentials,
+            'loaded_at': time.monotonic()
+        }
+
+def invalidate_client_credentials(client_id: str):
+    """Descarta credenciais e clientes do Drive em cache (novo OAuth ou desconexão)"""
+    _credentials_cache.pop(client_id, None)
+    invalidate_drive_client(client_id)
+
+def transport_credentials(client_id: str, credentials: Credentials) -> Credentials:
+    """Cópia das credenciais para um transporte HTTP, sem refresh token
+
+    O transporte renova sozinho no 401 ou quando o token vence; na cópia essa renovação
+    passa por get_client_credentials (trava por cliente e gravação no banco) em vez de
+    alterar no lugar as credenciais do cache.
+    """
+    def refresh_handler(request, scopes=None):
+        db = SessionLocal()
+        try:
+            service = GoogleDriveService(db)
+            fresh = service.get_client_credentials(client_id)
+            if fresh and fresh.token == copy.token:
+                # 401 com o token ainda no prazo: força a renovação pelo mesmo caminho
+                service.refresh_client_credentials(client_id, datetime.max)
+                fresh = service.get_client_credentials(client_id)
+        finally:
+            db.close()
+        if not fresh:
+            raise RefreshError("Cliente não tem Google Drive conectado")
+        # Tokens de acesso do Google valem uma hora quando o banco não guarda a expiração
+        return fresh.token, fresh.expiry or datetime.utcnow() + timedelta(hours=1)
+
+    copy = Credentials(
+        token=credentials.token,
+        expiry=credentials.expiry,
+        scopes=credentials.scopes,
+        refresh_handler=refresh_handler
+    )
+    return copy
+
+# Pasta do Drive de cada álbum em cache por processo; o prazo faz os outros workers
+# enxergarem um Folder ID alterado (só o worker que atendeu a alteração invalida na hora)
+ALBUM_FOLDER_CACHE_TTL = int(os.environ.get('ALBUM_FOLDER_CACHE_TTL', 60))
+ALBUM_FOLDER_CACHE_SIZE = int(os.environ.get('ALBUM_FOLDER_CACHE_SIZE', 1024))
+
+_album_folder_cache: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+_album_folder_cache_lock = threading.Lock()
+_album_folder_locks: Dict[str, threading.Lock] = {}
+_album_folder_locks_guard = threading.Lock()
+
+def _get_album_folder_lock(album_id: str) -> threading.Lock:
+    with _album_folder_locks_guard:
+        if album_id not in _album_folder_locks and len(_album_folder_locks) >= ALBUM_FOLDER_CACHE_SIZE:
+            # Descarta as travas livres; uma criação duplicada ainda é resolvida pela gravação condicional
+            for key in [key for key, lock in _album_folder_locks.items() if not lock.locked()]:
+                del _album_folder_locks[key]
+        return _album_folder_locks.setdefault(album_id, threading.Lock())
+
+def _get_cached_album_folder(album_id: str) -> Optional[str]:
+    with _album_folder_cache_lock:
+        entry = _album_folder_cache.get(album_id)
+        if not entry:
+            return None
+        if time.monotonic() - entry['loaded_at'] > ALBUM_FOLDER_CACHE_TTL:
+            del _album_folder_cache[album_id]
+            return None
+        _album_folder_cache.move_to_end(album_id)
+        return entry['folder_id']
+
+def _cache_album_folder(album_id: str, folder_id: str):
+    with _album_folder_cache_lock:
+        _album_folder_cache[album_id] = {'folder_id': folder_id, 'loaded_at': time.monotonic()}
+        _album_folder_cache.move_to_end(album_id)
+        while len(_album_folder_cache) > ALBUM_FOLDER_CACHE_SIZE:
+            _album_folder_cache.popitem(last=False)
+
+def invalidate_album_folder(album_id: str):
+    """Esquece a pasta em cache do álbum (ex.: Folder ID alterado pelo cliente)"""
+    with _album_folder_cache_lock:
+        _album_folder_cache.pop(album_id, None)
 
 class GoogleDriveService:
     def __init__(self, db: Session):
@@ -22,11 +197,9 @@ class GoogleDriveService:
             'openid'
         ]
     
-    def get_google_config(self) -> Optional[GoogleConfig]:
-        """Obtém a configuração ativa do Google Cloud API"""
-        return self.db.query(GoogleConfig).filter(
-            GoogleConfig.is_active == True
-        ).first()
+    def get_google_config(self) -> Optional[GoogleConfigSnapshot]:
+        """Obtém a configuração ativa do Google Cloud API (do retrato em memória, sem consulta)"""
+        return config_store.current().google
     
     def create_oauth_flow(self, redirect_uri: str) -> Flow:
         """Cria o fluxo OAuth2 para autenticação"""
@@ -113,17 +286,51 @@ class GoogleDriveService:
         self.db.commit()
         self.db.refresh(token_data)
         
+        invalidate_client_credentials(client_id)
+        
         return token_data
     
     def get_client_credentials(self, client_id: str) -> Optional[Credentials]:
-        """Obtém credenciais válidas para um cliente"""
+        """Obtém credenciais válidas para um cliente
+
+        Usa o cache do processo; na expiração apenas uma thread por cliente renova o
+        token e grava no banco, as demais esperam e reaproveitam o resultado.
+        """
+        credentials = _get_cached_credentials(client_id)
+        if credentials:
+            return credentials
+        
+        with _get_credentials_lock(client_id):
+            # Outra thread pode ter renovado enquanto esperávamos a trava
+            credentials = _get_cached_credentials(client_id)
+            if credentials:
+                return credentials
+            
+            credentials, _ = self._load_client_credentials(client_id)
+            _cache_credentials(client_id, credentials)
+            return credentials
+    
+    def refresh_client_credentials(self, client_id: str, refresh_before: datetime) -> bool:
+        """Renova antecipadamente o token se ele vencer antes de `refresh_before`
+
+        Usado pelo refresher em segundo plano; compartilha a trava do cliente com
+        get_client_credentials. Retorna True se o token foi renovado.
+        """
+        with _get_credentials_lock(client_id):
+            credentials, refreshed = self._load_client_credentials(client_id, refresh_before)
+            _cache_credentials(client_id, credentials)
+            return refreshed
+    
+    def _load_client_credentials(self, client_id: str,
+                                 refresh_before: Optional[datetime] = None) -> tuple[Optional[Credentials], bool]:
+        """Monta as credenciais a partir do banco, renovando o token se necessário"""
         token_data = self.db.query(GoogleToken).filter(
             GoogleToken.client_id == client_id,
             GoogleToken.is_active == True
         ).first()
         
         if not token_data:
-            return None
+            return None, False
         
         # Criar credenciais do Google
         credentials_info = {
@@ -139,10 +346,15 @@ class GoogleDriveService:
             credentials_info['client_secret'] = config.client_secret
         
         credentials = Credentials.from_authorized_user_info(credentials_info)
+        # Sem a expiração as credenciais parecem válidas para sempre e nunca são renovadas
+        credentials.expiry = token_data.expires_at
         
-        # Renovar token se necessário
-        if not credentials.valid and credentials.refresh_token:
+        # Renovar token se necessário (ou se vence antes do prazo pedido pelo refresher)
+        expiring = refresh_before is not None and credentials.expiry is not None and credentials.expiry <= refresh_before
+        refreshed = False
+        if (not credentials.valid or expiring) and credentials.refresh_token:
             credentials.refresh(Request())
+            refreshed = True
             
             # Atualizar token no banco
             token_data.access_token = credentials.token
@@ -151,16 +363,17 @@ class GoogleDriveService:
             token_data.updated_at = datetime.utcnow()
             self.db.commit()
         
-        return credentials if credentials.valid else None
+        return (credentials if credentials.valid else None), refreshed
     
-    def create_album_folder(self, client_id: str, album_name: str, event_date: str) -> Optional[str]:
+    def create_album_folder(self, client_id: str, album_name: str, event_date: str,
+                            credentials: Optional[Credentials] = None) -> Optional[str]:
         """Cria uma pasta no Google Drive para o álbum"""
-        credentials = self.get_client_credentials(client_id)
+        credentials = credentials or self.get_client_credentials(client_id)
         if not credentials:
             raise ValueError("Cliente não tem Google Drive conectado")
         
         try:
-            service = build('drive', 'v3', credentials=credentials)
+            service = get_drive_client(client_id, credentials)
             
             folder_name = f"{album_name} - {event_date}"
             folder_metadata = {
@@ -175,42 +388,112 @@ class GoogleDriveService:
             print(f"Erro ao criar pasta: {error}")
             return None
     
-    def upload_file(self, client_id: str, folder_id: str, file_content: bytes, 
-                   filename: str, mime_type: str) -> Optional[str]:
-        """Faz upload de um arquivo para o Google Drive"""
-        credentials = self.get_client_credentials(client_id)
+    def resolve_album_folder(self, album_id: str, credentials: Optional[Credentials] = None) -> str:
+        """Retorna a pasta do álbum no Drive, criando e gravando em Album.google_folder_id na primeira vez
+
+        Uploads simultâneos do mesmo álbum esperam a mesma criação; entre processos, a
+        gravação condicional garante que só uma pasta fica associada ao álbum.
+        """
+        folder_id = _get_cached_album_folder(album_id)
+        if folder_id:
+            return folder_id
+        
+        with _get_album_folder_lock(album_id):
+            folder_id = _get_cached_album_folder(album_id)
+            if folder_id:
+                return folder_id
+            
+            album = self.db.query(Album).filter(Album.id == album_id).first()
+            if not album:
+                raise ValueError("Álbum não encontrado")
+            
+            folder_id = (album.google_folder_id or '').strip()
+            if not folder_id:
+                event_date = album.event_date.strftime('%d/%m/%Y') if album.event_date else 'sem data'
+                created_id = self.create_album_folder(album.client_id, album.name, event_date, credentials)
+                if not created_id:
+                    raise ValueError("Falha ao criar pasta do álbum no Google Drive")
+                
+                # Só grava se nenhum outro processo gravou uma pasta nesse meio tempo
+                saved = self.db.query(Album).filter(
+                    Album.id == album_id,
+                    or_(Album.google_folder_id == None, Album.google_folder_id == '')
+                ).update({'google_folder_id': created_id}, synchronize_session=False)
+                self.db.commit()
+                
+                if saved:
+                    folder_id = created_id
+                    print(f"DEBUG: Pasta do álbum {album_id} criada com ID: {folder_id}")
+                else:
+                    folder_id = self.db.query(Album.google_folder_id).filter(Album.id == album_id).scalar()
+                    self.delete_file(album.client_id, created_id, credentials)
+            
+            _cache_album_folder(album_id, folder_id)
+            return folder_id
+    
+    def delete_file(self, client_id: str, file_id: str, credentials: Optional[Credentials] = None) -> bool:
+        """Remove um arquivo ou pasta do Drive (melhor esforço)"""
+        credentials = credentials or self.get_client_credentials(client_id)
+        if not credentials:
+            return False
+        
+        try:
+            get_drive_client(client_id, credentials).files().delete(fileId=file_id).execute()
+            return True
+        except HttpError as error:
+            print(f"Erro ao remover arquivo {file_id}: {error}")
+            return False
+    
+    def upload_file(self, client_id: str, folder_id: str, file_content: Union[bytes, BinaryIO],
+                   filename: str, mime_type: str, credentials: Optional[Credentials] = None,
+                   on_chunk: Optional[Callable[[], None]] = None) -> Optional[str]:
+        """Faz upload de um arquivo para o Google Drive
+
+        Aceita bytes ou um arquivo binário aberto; arquivos são enviados em blocos de
+        DRIVE_UPLOAD_CHUNK_SIZE sem serem carregados inteiros na memória. Quem já tem
+        as credenciais (ex.: uploads em lote em paralelo) pode passá-las e evitar o banco.
+        on_chunk é chamado após cada bloco (uma exceção nele interrompe o envio).
+        """
+        credentials = credentials or self.get_client_credentials(client_id)
         if not credentials:
             raise ValueError("Cliente não tem Google Drive conectado")
         
         try:
-            service = build('drive', 'v3', credentials=credentials)
+            service = get_drive_client(client_id, credentials)
             
-            # Se folder_id estiver vazio, criar pasta automaticamente
+            # A pasta do álbum é resolvida uma única vez em resolve_album_folder
             if not folder_id or folder_id.strip() == '':
-                print("DEBUG: Folder ID vazio, criando pasta automaticamente...")
-                folder_id = self.create_album_folder(client_id, "UpnaFesta", "Album")
-                if not folder_id:
-                    raise ValueError("Falha ao criar pasta automaticamente")
-                print(f"DEBUG: Pasta criada automaticamente com ID: {folder_id}")
+                raise ValueError("Pasta do Google Drive não informada")
             
             file_metadata = {
                 'name': filename,
-                'parents': [folder_id] if folder_id else []
+                'parents': [folder_id]
             }
             
+            stream = BytesIO(file_content) if isinstance(file_content, (bytes, bytearray)) else file_content
+            stream.seek(0)
+            
             media = MediaIoBaseUpload(
-                BytesIO(file_content),
-                mimetype=mime_type,
+                stream,
+                mimetype=mime_type or 'application/octet-stream',
+                chunksize=DRIVE_UPLOAD_CHUNK_SIZE,
                 resumable=True
             )
             
             print(f"DEBUG: Tentando upload - filename: {filename}, folder_id: {folder_id}")
             
-            file = service.files().create(
+            request = service.files().create(
                 body=file_metadata,
                 media_body=media,
                 fields="id,name,size"
-            ).execute()
+            )
+            
+            # Enviar bloco a bloco; next_chunk retoma a sessão resumível em caso de falha
+            file = None
+            while file is None:
+                _, file = request.next_chunk(num_retries=3)
+                if on_chunk:
+                    on_chunk()
             
             print(f"DEBUG: Upload sucesso - file_id: {file.get('id')}")
             return file.get('id')
@@ -224,6 +507,71 @@ class GoogleDriveService:
             print(f"ERROR: Erro geral no upload: {error}")
             raise error
     
+    def create_resumable_upload_session(self, client_id: str, folder_id: str, filename: str,
+                                        mime_type: Optional[str], size: Optional[int],
+                                        origin: Optional[str] = None) -> str:
+        """Abre uma sessão de upload resumível no Drive e retorna a URL para o navegador enviar direto"""
+        credentials = self.get_client_credentials(client_id)
+        if not credentials:
+            raise ValueError("Cliente não tem Google Drive conectado")
+        
+        headers = {
+            'Content-Type': 'application/json; charset=UTF-8',
+            'X-Upload-Content-Type': mime_type or 'application/octet-stream'
+        }
+        if size:
+            headers['X-Upload-Content-Length'] = str(size)
+        if origin:
+            # O Drive só libera CORS na URL da sessão para o Origin informado na criação
+            headers['Origin'] = origin
+        
+        response = AuthorizedSession(transport_credentials(client_id, credentials)).post(
+            DRIVE_RESUMABLE_UPLOAD_URL,
+            json={'name': filename, 'parents': [folder_id]},
+            headers=headers,
+            timeout=30
+        )
+        
+        if response.status_code != 200 or 'Location' not in response.headers:
+            print(f"ERROR: Falha ao abrir sessão resumível: {response.status_code} {response.text}")
+            raise ValueError(f"Google Drive recusou a sessão de upload ({response.status_code})")
+        
+        return response.headers['Location']
+    
+    def get_file_metadata(self, client_id: str, file_id: str) -> Dict[str, Any]:
+        """Obtém nome, tamanho, tipo e pastas de um arquivo do Drive"""
+        credentials = self.get_client_credentials(client_id)
+        if not credentials:
+            raise ValueError("Cliente não tem Google Drive conectado")
+        
+        service = get_drive_client(client_id, credentials)
+        return service.files().get(
+            fileId=file_id,
+            fields="id,name,size,mimeType,parents"
+        ).execute()
+    
+    def get_file_sha256(self, client_id: str, file_id: str) -> Optional[str]:
+        """SHA-256 calculado pelo próprio Drive (ausente em arquivos antigos ou do Google Docs)"""
+        credentials = self.get_client_credentials(client_id)
+        if not credentials:
+            raise ValueError("Cliente não tem Google Drive conectado")
+        
+        service = get_drive_client(client_id, credentials)
+        metadata = service.files().get(fileId=file_id, fields="sha256Checksum").execute()
+        return metadata.get('sha256Checksum')
+    
+    def download_file(self, client_id: str, file_id: str, out: BinaryIO):
+        """Baixa o conteúdo de um arquivo do Drive para um arquivo aberto, em blocos"""
+        credentials = self.get_client_credentials(client_id)
+        if not credentials:
+            raise ValueError("Cliente não tem Google Drive conectado")
+        
+        request = get_drive_client(client_id, credentials).files().get_media(fileId=file_id)
+        downloader = MediaIoBaseDownload(out, request, chunksize=DRIVE_UPLOAD_CHUNK_SIZE)
+        done = False
+        while not done:
+            _, done = downloader.next_chunk(num_retries=3)
+    
     def disconnect_client(self, client_id: str) -> bool:
         """Desconecta o Google Drive de um cliente"""
         try:
@@ -234,6 +582,7 @@ class GoogleDriveService:
             ).update({'is_active': False, 'updated_at': datetime.utcnow()})
             
             self.db.commit()
+            invalidate_client_credentials(client_id)
             return updated > 0
             
         except Exception as error:
@@ -0,0 +1,144 @@
+"""Processamento de imagens que roda nos processos do image_executor
+
+Este módulo só depende do Pillow e do NumPy para ficar leve ao ser importado pelos processos filhos.
+"""
+import hashlib
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+from typing import Dict, Iterable, Optional, Tuple
+
+import numpy as np
+from PIL import Image, ImageOps
+
+IMAGE_WORKERS = int(os.environ.get('IMAGE_WORKERS', 2))
+THUMBNAIL_QUALITY = int(os.environ.get('THUMBNAIL_QUALITY', 80))
+
+HASH_CHUNK_SIZE = 1024 * 1024
+
+# Formatos que o Pillow abre sem plugins extras
+IMAGE_MIME_TYPES = {'image/jpeg', 'image/png', 'image/webp', 'image/gif', 'image/bmp', 'image/tiff'}
+
+# spawn: o processo do servidor tem threads e conexões abertas, que não devem ser herdadas por fork
+image_executor = ProcessPoolExecutor(
+    max_workers=IMAGE_WORKERS,
+    mp_context=multiprocessing.get_context('spawn')
+)
+
+def is_image(mime_type: str) -> bool:
+    return (mime_type or '').lower() in IMAGE_MIME_TYPES
+
+def hash_file(path: str) -> str:
+    """SHA-256 do arquivo, lido em blocos"""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as source:
+        for block in iter(lambda: source.read(HASH_CHUNK_SIZE), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+def thumbnail_path(cache_dir: str, content_hash: str, size: int) -> Path:
+    """Caminho da miniatura no cache endereçado por conteúdo"""
+    return Path(cache_dir) / content_hash[:2] / f"{content_hash}_{size}.jpg"
+
+PHASH_IMAGE_SIZE = 32
+PHASH_DCT_SIZE = 8
+# Redução fixa de onde sai o pHash, para ele não depender de quais miniaturas já estavam no cache
+PHASH_SOURCE_SIZE = 256
+
+def _dct_matrix(size: int) -> np.ndarray:
+    """Matriz da DCT-II ortonormal (dispensa o SciPy)"""
+    k = np.arange(size)[:, None]
+    n = np.arange(size)[None, :]
+    matrix = np.sqrt(2 / size) * np.cos(np.pi * (2 * n + 1) * k / (2 * size))
+    matrix[0] /= np.sqrt(2)
+    return matrix
+
+_PHASH_DCT = _dct_matrix(PHASH_IMAGE_SIZE)
+
+def perceptual_hash(image: Image.Image) -> int:
+    """pHash de 64 bits: sinais das frequências baixas da DCT em relação à mediana
+
+    Retornado como inteiro com sinal, para caber numa coluna BIGINT.
+    """
+    gray = image.convert('L').resize((PHASH_IMAGE_SIZE, PHASH_IMAGE_SIZE), Image.LANCZOS)
+    pixels = np.asarray(gray, dtype=np.float64)
+    low = (_PHASH_DCT @ pixels @ _PHASH_DCT.T)[:PHASH_DCT_SIZE, :PHASH_DCT_SIZE].flatten()
+    # O termo DC (brilho médio) fica fora da mediana
+    bits = low > np.median(low[1:])
+    return int(np.packbits(bits).view('>i8')[0])
+
+def render_thumbnails(source_path: str, cache_dir: str,
+                      sizes: Iterable[int]) -> Tuple[str, Dict[int, int], Optional[int]]:
+    """Gera as miniaturas que ainda não existem no cache
+
+    Retorna o hash do original, o tamanho em bytes de cada miniatura gerada e o
+    hash perceptual da foto. A decodificação e a redução usadas no pHash são sempre
+    as mesmas, gere-se uma miniatura ou todas.
+    """
+    content_hash = hash_file(source_path)
+    missing = sorted(
+        (size for size in sizes if not thumbnail_path(cache_dir, content_hash, size).exists()),
+        reverse=True
+    )
+
+    generated = {}
+    with Image.open(source_path) as image:
+        # Decodifica JPEGs já reduzidos, bem mais rápido que abrir a foto inteira; a escala
+        # depende só da configuração (não do que falta no cache), senão o pHash mudaria
+        draft_size = max(max(sizes), PHASH_SOURCE_SIZE)
+        image.draft('RGB', (draft_size, draft_size))
+        image = ImageOps.exif_transpose(image).convert('RGB')
+
+        phash_source = image.copy()
+        phash_source.thumbnail((PHASH_SOURCE_SIZE, PHASH_SOURCE_SIZE), Image.LANCZOS)
+        phash = perceptual_hash(phash_source)
+
+        # Do maior para o menor, reaproveitando a redução anterior
+        for size in missing:
+            image.thumbnail((size, size), Image.LANCZOS)
+            path = thumbnail_path(cache_dir, content_hash, size)
+            path.parent.mkdir(parents=True, exist_ok=True)
+            partial_path = path.with_suffix('.part')
+            image.save(partial_path, 'JPEG', quality=THUMBNAIL_QUALITY, optimize=True, progressive=True)
+            os.replace(partial_path, path)
+            generated[size] = path.stat().st_size
+
+    return content_hash, generated, phash
+
+# Formatos recomprimidos antes do envio ao Drive (mantendo o formato original)
+RECOMPRESS_FORMATS = {'JPEG', 'PNG', 'WEBP'}
+
+def recompress_image(source_path: str, dest_path: str, max_edge: int, quality: int) -> Optional[int]:
+    """Reduz a foto para `max_edge` no maior lado e recomprime no mesmo formato
+
+    A orientação EXIF é aplicada aos pixels e os demais metadados EXIF são mantidos.
+    Retorna o tamanho do resultado, ou None quando não compensa (formato não suportado
+    ou arquivo final maior que o original).
+    """
+    with Image.open(source_path) as image:
+        image_format = image.format
+        if image_format not in RECOMPRESS_FORMATS:
+            return None
+
+        if image_format == 'JPEG':
+            image.draft('RGB', (max_edge, max_edge))
+        # exif_transpose gira os pixels e remove só a tag de orientação do EXIF
+        image = ImageOps.exif_transpose(image)
+        image.thumbnail((max_edge, max_edge), Image.LANCZOS)
+
+        save_options = {'exif': image.getexif()}
+        if image_format == 'JPEG':
+            image = image.convert('RGB')
+            save_options.update(quality=quality, optimize=True, progressive=True)
+        elif image_format == 'WEBP':
+            save_options.update(quality=quality)
+        else:
+            save_options.update(optimize=True)
+
+        image.save(dest_path, image_format, **save_options)
+
+    stored_size = os.path.getsize(dest_path)
+    if stored_size >= os.path.getsize(source_path):
+        return None
+    return stored_size
@@ -0,0 +1,35 @@
+"""Cursores opacos para paginação por chave (keyset), sem OFFSET"""
+import base64
+import json
+from datetime import datetime
+from typing import Any, Callable, Optional, Tuple, Union
+
+def encode_cursor(sort_value: Union[datetime, str, None], row_id: str, sort_key: Optional[str] = None) -> str:
+    """Cursor apontando para depois da linha (sort_value, row_id)
+
+    sort_key identifica a ordenação da listagem, para um cursor não ser reaproveitado em outra.
+    """
+    value = sort_value.isoformat() if isinstance(sort_value, datetime) else sort_value
+    items = [value, row_id] + ([sort_key] if sort_key else [])
+    payload = json.dumps(items, separators=(',', ':'))
+    return base64.urlsafe_b64encode(payload.encode()).decode().rstrip('=')
+
+def decode_cursor(
+    cursor: str,
+    sort_key: Optional[str] = None,
+    parse: Callable[[str], Any] = datetime.fromisoformat
+) -> Tuple[Any, str]:
+    """Inverso de encode_cursor; ValueError se o cursor não for válido (ou for de outra ordenação)"""
+    try:
+        padded = cursor + '=' * (-len(cursor) % 4)
+        items = json.loads(base64.urlsafe_b64decode(padded.encode()))
+        sort_value, row_id = items[0], items[1]
+        cursor_key = items[2] if len(items) > 2 else None
+    except (ValueError, TypeError, IndexError, KeyError) as error:
+        raise ValueError("Cursor inválido") from error
+    if cursor_key != sort_key:
+        raise ValueError("Cursor inválido")
+    try:
+        return (parse(sort_value) if sort_value is not None else None), str(row_id)
+    except (ValueError, TypeError) as error:
+        raise ValueError("Cursor inválido") from error
@@ -0,0 +1,145 @@
+"""Índice por álbum dos hashes perceptuais, com busca vetorizada por distância de Hamming"""
+import os
+import threading
+import time
+from typing import Dict, List, NamedTuple, Tuple
+
+import numpy as np
+
+from database import SessionLocal, Upload
+
+PHASH_INDEX_TTL_SECONDS = int(os.environ.get('PHASH_INDEX_TTL_SECONDS', 300))
+PHASH_INDEX_MAX_ALBUMS = int(os.environ.get('PHASH_INDEX_MAX_ALBUMS', 64))
+
+# Distância padrão para considerar duas fotos quase iguais (em bits, de 64)
+PHASH_DEFAULT_MAX_DISTANCE = int(os.environ.get('PHASH_DEFAULT_MAX_DISTANCE', 6))
+PHASH_MAX_DISTANCE_LIMIT = 10
+
+_POPCOUNT = np.array([bin(value).count('1') for value in range(256)], dtype=np.uint8)
+
+def to_unsigned(phash: int) -> np.uint64:
+    """Hash gravado com sinal (BIGINT) para o uint64 usado no índice"""
+    return np.uint64(phash & 0xFFFFFFFFFFFFFFFF)
+
+def popcount(values: np.ndarray) -> np.ndarray:
+    """Bits ligados em cada uint64 (qualquer formato de array)"""
+    if hasattr(np, 'bitwise_count'):
+        return np.bitwise_count(values)
+    bytes_view = np.ascontiguousarray(values).view(np.uint8)
+    return _POPCOUNT[bytes_view].reshape(values.shape + (8,)).sum(axis=-1)
+
+class AlbumHashes(NamedTuple):
+    """Retrato imutável dos hashes de um álbum: trocado inteiro a cada alteração"""
+    upload_ids: List[str]
+    hashes: np.ndarray  # uint64, alinhado com upload_ids
+    loaded_at: float
+
+class PerceptualHashIndex:
+    """Hashes perceptuais em memória por álbum, carregados com uma consulta só"""
+
+    def __init__(self, ttl_seconds: int = PHASH_INDEX_TTL_SECONDS, max_albums: int = PHASH_INDEX_MAX_ALBUMS):
+        self.ttl_seconds = ttl_seconds
+        self.max_albums = max_albums
+        self._albums: Dict[str, AlbumHashes] = {}
+        self._lock = threading.Lock()
+
+    def _load(self, album_id: str) -> AlbumHashes:
+        db = SessionLocal()
+        try:
+            rows = db.query(Upload.id, Upload.phash).filter(
+                Upload.album_id == album_id,
+                Upload.status == 'stored',
+                Upload.phash != None
+            ).all()
+        finally:
+            db.close()
+
+        hashes = np.array([row.phash for row in rows], dtype=np.int64).view(np.uint64)
+        return AlbumHashes([row.id for row in rows], hashes, time.monotonic())
+
+    def get(self, album_id: str) -> AlbumHashes:
+        """Hashes do álbum (bloqueante na primeira chamada ou quando o retrato expira)"""
+        entry = self._albums.get(album_id)
+        if entry is None or time.monotonic() - entry.loaded_at > self.ttl_seconds:
+            # Outros processos também gravam uploads: o TTL limita quanto tempo ficamos sem vê-los
+            entry = self._load(album_id)
+            with self._lock:
+                self._albums.pop(album_id, None)
+                self._albums[album_id] = entry
+                while len(self._albums) > self.max_albums:
+                    self._albums.pop(next(iter(self._albums)))
+        return entry
+
+    def add(self, album_id: str, upload_id: str, phash: int):
+        """Inclui um hash recém-calculado, se o álbum já estiver carregado"""
+        with self._lock:
+            entry = self._albums.get(album_id)
+            if entry is None or upload_id in entry.upload_ids:
+                return
+            self._albums[album_id] = AlbumHashes(
+                entry.upload_ids + [upload_id],
+                np.append(entry.hashes, to_unsigned(phash)),
+                entry.loaded_at
+            )
+
+    def invalidate(self, album_id: str):
+        with self._lock:
+            self._albums.pop(album_id, None)
+
+    def search(self, album_id: str, phash: int,
+               max_distance: int = PHASH_DEFAULT_MAX_DISTANCE) -> List[Tuple[str, int]]:
+        """Uploads do álbum a até `max_distance` bits do hash, do mais parecido ao menos"""
+        entry = self.get(album_id)
+        if not entry.upload_ids:
+            return []
+
+        distances = popcount(entry.hashes ^ to_unsigned(phash))
+        matches = np.flatnonzero(distances <= max_distance)
+        matches = matches[np.argsort(distances[matches], kind='stable')]
+        return [(entry.upload_ids[index], int(distances[index])) for index in matches]
+
+    def clusters(self, album_id: str, max_distance: int = PHASH_DEFAULT_MAX_DISTANCE) -> List[List[str]]:
+        """Grupos de fotos quase iguais do álbum (componentes conexos por distância)
+
+        Divide os 64 bits em max_distance + 1 faixas: duas fotos a até max_distance
+        bits coincidem em pelo menos uma faixa inteira, então só comparamos fotos que
+        caem no mesmo balde de alguma faixa, em vez de todos os pares do álbum.
+        """
+        entry = self.get(album_id)
+        count = len(entry.upload_ids)
+        if count < 2:
+            return []
+
+        parent = list(range(count))
+
+        def find(index: int) -> int:
+            while parent[index] != index:
+                parent[index] = parent[parent[index]]
+                index = parent[index]
+            return index
+
+        bounds = np.linspace(0, 64, max_distance + 2).astype(int)
+        for low, high in zip(bounds[:-1], bounds[1:]):
+            mask = np.uint64((1 << int(high - low)) - 1)
+            keys = (entry.hashes >> np.uint64(low)) & mask
+            order = np.argsort(keys, kind='stable')
+            sorted_keys = keys[order]
+
+            starts = np.flatnonzero(np.r_[True, sorted_keys[1:] != sorted_keys[:-1]])
+            ends = np.r_[starts[1:], count]
+            shared = ends - starts > 1
+            for start, end in zip(starts[shared], ends[shared]):
+                members = order[start:end]
+                group = entry.hashes[members]
+                close = popcount(group[:, None] ^ group[None, :]) <= max_distance
+                for i, j in zip(*np.nonzero(np.triu(close, 1))):
+                    root_i, root_j = find(int(members[i])), find(int(members[j]))
+                    if root_i != root_j:
+                        parent[max(root_i, root_j)] = min(root_i, root_j)
+
+        groups: Dict[int, List[str]] = {}
+        for index in range(count):
+            groups.setdefault(find(index), []).append(entry.upload_ids[index])
+        return [members for members in groups.values() if len(members) > 1]
+
+phash_index = PerceptualHashIndex()
@@ -0,0 +1,102 @@
+"""Métricas dos pools de conexão: ocupação, overflow, tempo de espera no checkout e timeouts"""
+import bisect
+import os
+import threading
+from datetime import datetime
+from time import perf_counter
+from typing import Any, Dict, List, Optional, Type
+
+from sqlalchemy import exc
+from sqlalchemy.pool import Pool, QueuePool
+
+# Limites superiores (ms) das faixas do histograma de espera; a última faixa é "acima do maior limite"
+POOL_WAIT_BUCKETS_MS = tuple(
+    float(bound) for bound in os.environ.get('DB_POOL_WAIT_BUCKETS_MS', '1,5,10,25,50,100,250,500,1000,5000').split(',')
+)
+
+class PoolMetrics:
+    """Contadores de um pool (por processo: cada worker do uvicorn tem os seus)"""
+
+    def __init__(self, name: str, buckets_ms=POOL_WAIT_BUCKETS_MS):
+        self.name = name
+        self.buckets_ms = tuple(sorted(buckets_ms))
+        self.pool: Optional[Pool] = None
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self.checkouts = 0
+            self.timeouts = 0
+            self.wait_total_ms = 0.0
+            self.wait_max_ms = 0.0
+            self.histogram: List[int] = [0] * (len(self.buckets_ms) + 1)
+            self.last_timeout_at: Optional[str] = None
+            self.since = datetime.utcnow().isoformat()
+
+    def record_wait(self, elapsed_ms: float):
+        with self._lock:
+            self.checkouts += 1
+            self.wait_total_ms += elapsed_ms
+            self.wait_max_ms = max(self.wait_max_ms, elapsed_ms)
+            self.histogram[bisect.bisect_left(self.buckets_ms, elapsed_ms)] += 1
+
+    def record_timeout(self):
+        with self._lock:
+            self.timeouts += 1
+            self.last_timeout_at = datetime.utcnow().isoformat()
+
+    def snapshot(self) -> Dict[str, Any]:
+        pool = self.pool
+        state: Dict[str, Any] = {'pool': type(pool).__name__ if pool else None}
+        if isinstance(pool, QueuePool):
+            state.update({
+                'size': pool.size(),
+                'checked_out': pool.checkedout(),
+                'checked_in': pool.checkedin(),
+                'overflow': pool.overflow(),
+                'max_overflow': pool._max_overflow,
+                'timeout_seconds': pool.timeout(),
+            })
+
+        with self._lock:
+            labels = [f"<={bound:g}ms" for bound in self.buckets_ms] + [f">{self.buckets_ms[-1]:g}ms"]
+            return {
+                'name': self.name,
+                **state,
+                'checkouts': self.checkouts,
+                'timeouts': self.timeouts,
+                'last_timeout_at': self.last_timeout_at,
+                'wait_avg_ms': round(self.wait_total_ms / self.checkouts, 3) if self.checkouts else 0.0,
+                'wait_max_ms': round(self.wait_max_ms, 3),
+                'wait_histogram': dict(zip(labels, self.histogram)),
+                'since': self.since,
+            }
+
+def instrumented_pool_class(base: Type[QueuePool], metrics: PoolMetrics) -> Type[QueuePool]:
+    """Subclasse do pool que mede o tempo até obter uma conexão
+
+    O tempo inclui abrir uma conexão nova quando o pool cresce no overflow. A classe
+    carrega as métricas como atributo para sobreviver ao recreate() feito pelo dispose().
+    """
+
+    class InstrumentedPool(base):
+        pool_metrics = metrics
+
+        def __init__(self, *args, **kwargs):
+            super().__init__(*args, **kwargs)
+            self.pool_metrics.pool = self
+
+        def _do_get(self):
+            started = perf_counter()
+            try:
+                connection = super()._do_get()
+            except exc.TimeoutError:
+                self.pool_metrics.record_timeout()
+                raise
+            self.pool_metrics.record_wait((perf_counter() - started) * 1000)
+            return connection
+
+    InstrumentedPool.__name__ = f"Instrumented{base.__name__}"
+    InstrumentedPool.__qualname__ = InstrumentedPool.__name__
+    return InstrumentedPool
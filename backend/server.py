@@ -1,20 +1,52 @@
-from fastapi import FastAPI, APIRouter, HTTPException, Depends, UploadFile, File, Form
-from fastapi.responses import RedirectResponse
+from fastapi import FastAPI, APIRouter, HTTPException, Depends, UploadFile, File, Form, Request, Header, Query, Response
+from fastapi.responses import RedirectResponse, JSONResponse, FileResponse, StreamingResponse
 from dotenv import load_dotenv
 from starlette.middleware.cors import CORSMiddleware
-from motor.motor_asyncio import AsyncIOMotorClient
-from sqlalchemy.orm import Session
+from starlette.concurrency import run_in_threadpool
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session, joinedload, selectinload
 import os
+import asyncio
+import json
 import logging
+import time
+import weakref
 from pathlib import Path
 from pydantic import BaseModel, Field
-from typing import List, Optional
+from typing import List, Optional, Tuple
 import uuid
 from datetime import datetime, timedelta
 
 # Import database models and services
-from database import get_db, create_tables, GoogleConfig, Client, Album, GoogleToken, Notification, SiteColors, SystemSettings
-from google_drive_service import GoogleDriveService, get_redirect_uris_info
+from database import (
+    get_db, get_async_db, SessionLocal, AsyncSessionLocal, create_tables, sync_pool_metrics, async_pool_metrics,
+    GoogleConfig, Client, Album, GoogleToken, Notification, SiteColors, SystemSettings, Upload, DashboardCounters
+)
+from google_drive_service import GoogleDriveService, get_redirect_uris_info, invalidate_album_folder
+from executors import run_in_drive_pool, configure_threadpool, shutdown_executors
+from upload_spool import upload_spool
+from token_refresher import token_refresher
+from image_processing import is_image
+from thumbnails import thumbnail_cache, thumbnail_pipeline, thumbnail_key_for, THUMBNAIL_SIZES
+from pagination import encode_cursor, decode_cursor
+from status_store import status_store, MongoNotConfigured, STATUS_LIST_DEFAULT_LIMIT, STATUS_LIST_MAX_LIMIT
+from storage_stats import get_storage_rollup
+from config_snapshot import config_store, bump_config_version
+from album_expiry import album_expiry_sweeper
+from site_colors import (
+    SITE_COLORS_CACHE_CONTROL, CachedSiteColors, colors_version, render_css,
+    ensure_default_site_colors, site_colors_cache
+)
+from dashboard_counters import (
+    COUNTERS_ROW_ID, bump_counters, bump_album_status, bump_stored_uploads, read_counters, counter_reconciler
+)
+from phash_index import phash_index, PHASH_DEFAULT_MAX_DISTANCE, PHASH_MAX_DISTANCE_LIMIT
+from upload_processing import push_to_drive, hash_stream, find_duplicate_upload, dedup_single_flight, save_new_upload
+from upload_sessions import (
+    UPLOAD_SESSION_CHUNK_SIZE, UPLOAD_SESSION_MAX_SIZE, parse_content_range, create_upload_session,
+    get_upload_session, write_session_chunk, commit_session_offset, finalize_upload_session, upload_session_sweeper
+)
 
 # Utility functions
 def calculate_album_expiry(event_date, expiry_days):
@@ -31,8 +63,8 @@ def calculate_album_expiry(event_date, expiry_days):
 def update_album_expiry(album, db_session):
     """Atualizar data de vencimento do álbum"""
     if album.event_date:
-        # Buscar configurações do sistema
-        settings = db_session.query(SystemSettings).filter(SystemSettings.is_active == True).first()
+        # Configurações do sistema vêm do retrato em memória (sem consulta por álbum)
+        settings = config_store.current().settings
         if settings:
             album.expires_at = calculate_album_expiry(album.event_date, settings.album_expiry_days)
             
@@ -46,10 +78,24 @@ def update_album_expiry(album, db_session):
 ROOT_DIR = Path(__file__).parent
 load_dotenv(ROOT_DIR / '.env')
 
-# MongoDB connection (mantendo compatibilidade)
-mongo_url = os.environ['MONGO_URL']
-client = AsyncIOMotorClient(mongo_url)
-db = client[os.environ['DB_NAME']]
+# direct: envia ao Drive durante a requisição; spool: grava localmente e responde 202
+UPLOAD_INGEST_MODE = os.environ.get('UPLOAD_INGEST_MODE', 'direct')
+
+# Uploads em lote: máximo de arquivos por requisição e de envios simultâneos ao Drive por álbum
+BATCH_UPLOAD_MAX_FILES = int(os.environ.get('BATCH_UPLOAD_MAX_FILES', 100))
+BATCH_UPLOAD_CONCURRENCY = int(os.environ.get('BATCH_UPLOAD_CONCURRENCY', 4))
+
+# Listagem de uploads: itens por página
+UPLOAD_LIST_DEFAULT_LIMIT = int(os.environ.get('UPLOAD_LIST_DEFAULT_LIMIT', 50))
+UPLOAD_LIST_MAX_LIMIT = int(os.environ.get('UPLOAD_LIST_MAX_LIMIT', 200))
+
+# Listagem de clientes do admin: itens por página e colunas aceitas em ?sort=
+CLIENT_LIST_DEFAULT_LIMIT = int(os.environ.get('CLIENT_LIST_DEFAULT_LIMIT', 50))
+CLIENT_LIST_MAX_LIMIT = int(os.environ.get('CLIENT_LIST_MAX_LIMIT', 200))
+CLIENT_SORT_COLUMNS = {'created_at': Client.created_at, 'name': Client.name, 'email': Client.email}
+
+# Semáforo por álbum, compartilhado entre lotes simultâneos do mesmo álbum
+_album_upload_semaphores = weakref.WeakValueDictionary()
 
 # Create the main app without a prefix
 app = FastAPI()
@@ -60,11 +106,25 @@ api_router = APIRouter(prefix="/api")
 # Create database tables on startup
 @app.on_event("startup")
 async def startup_event():
+    configure_threadpool()
     try:
         create_tables()
+        seed_db = SessionLocal()
+        try:
+            ensure_default_site_colors(seed_db)
+        finally:
+            seed_db.close()
         print("Tabelas do banco criadas com sucesso!")
     except Exception as e:
         print(f"Erro ao criar tabelas: {e}")
+    
+    await config_store.start()
+    await thumbnail_pipeline.start()
+    await upload_spool.start()
+    await upload_session_sweeper.start()
+    await token_refresher.start()
+    await counter_reconciler.start()
+    await album_expiry_sweeper.start()
 
 # Define Models
 class StatusCheck(BaseModel):
@@ -121,6 +181,9 @@ class AlbumUpdate(BaseModel):
     welcome_message: Optional[str] = None
     thank_you_message: Optional[str] = None
     google_folder_id: Optional[str] = None
+    recompress_images: Optional[bool] = None
+    recompress_max_edge: Optional[int] = Field(default=None, ge=320, le=8192)
+    recompress_quality: Optional[int] = Field(default=None, ge=30, le=95)
 
 class AlbumResponse(BaseModel):
     id: str
@@ -134,10 +197,98 @@ class AlbumResponse(BaseModel):
     main_photo: Optional[str]
     welcome_message: Optional[str]
     thank_you_message: Optional[str]
+    recompress_images: Optional[bool] = False
+    recompress_max_edge: Optional[int] = None
+    recompress_quality: Optional[int] = None
     
     class Config:
         from_attributes = True
 
+class GoogleStatusResponse(BaseModel):
+    connected: bool
+    email: Optional[str] = None
+    expires_at: Optional[datetime] = None
+
+class NotificationResponse(BaseModel):
+    id: str
+    title: str
+    message: str
+    type: str
+    read: bool
+    created_at: datetime
+    
+    class Config:
+        from_attributes = True
+
+class ClientDashboardResponse(BaseModel):
+    client: ClientResponse
+    albums: List[AlbumResponse]
+    google: GoogleStatusResponse
+    unread_notifications: List[NotificationResponse]
+
+class UploadStatusResponse(BaseModel):
+    id: str
+    album_id: str
+    filename: str
+    status: str
+    google_file_id: Optional[str]
+    attempts: Optional[int]
+    last_error: Optional[str]
+    uploaded_at: datetime
+    
+    class Config:
+        from_attributes = True
+
+class UploadResponse(BaseModel):
+    id: str
+    album_id: str
+    filename: str
+    google_file_id: Optional[str]
+    uploaded_by: str
+    upload_comment: Optional[str]
+    file_size: Optional[str]
+    size_bytes: Optional[int]
+    mime_type: Optional[str]
+    status: str
+    uploaded_at: datetime
+    
+    class Config:
+        from_attributes = True
+
+class UploadListResponse(BaseModel):
+    uploads: List[UploadResponse]
+    next_cursor: Optional[str] = None
+
+class UploadSessionCreate(BaseModel):
+    filename: str
+    mime_type: Optional[str] = None
+    total_size: int = Field(gt=0, le=UPLOAD_SESSION_MAX_SIZE)
+    guest_name: str
+    comment: Optional[str] = None
+
+class UploadSessionResponse(BaseModel):
+    id: str
+    album_id: str
+    filename: str
+    total_size: int
+    committed_offset: int
+    status: str
+    upload_id: Optional[str]
+    chunk_size: int = UPLOAD_SESSION_CHUNK_SIZE
+    
+    class Config:
+        from_attributes = True
+
+class DirectUploadCreate(BaseModel):
+    filename: str
+    mime_type: Optional[str] = None
+    size: Optional[int] = Field(default=None, gt=0)
+
+class DirectUploadComplete(BaseModel):
+    google_file_id: str
+    guest_name: str
+    comment: Optional[str] = None
+
 class SiteColorsCreate(BaseModel):
     primary: str = "#8B4513"
     secondary: str = "#DEB887"
@@ -209,19 +360,53 @@ async def root():
 
 @api_router.post("/status", response_model=StatusCheck)
 async def create_status_check(input: StatusCheckCreate):
-    status_dict = input.dict()
-    status_obj = StatusCheck(**status_dict)
-    _ = await db.status_checks.insert_one(status_obj.dict())
+    status_obj = StatusCheck(**input.model_dump())
+    try:
+        await status_store.insert(status_obj.model_dump())
+    except MongoNotConfigured as e:
+        raise HTTPException(status_code=503, detail=str(e))
     return status_obj
 
-@api_router.get("/status", response_model=List[StatusCheck])
-async def get_status_checks():
-    status_checks = await db.status_checks.find().to_list(1000)
-    return [StatusCheck(**status_check) for status_check in status_checks]
+@api_router.get("/status")
+async def get_status_checks(
+    cursor: Optional[str] = None,
+    limit: int = Query(STATUS_LIST_DEFAULT_LIMIT, ge=1, le=STATUS_LIST_MAX_LIMIT)
+):
+    """Status checks em NDJSON, mais recentes primeiro
+    
+    Uma linha por status check; se houver mais páginas, a última linha é
+    {"next_cursor": "..."} para repassar em ?cursor=.
+    """
+    after_timestamp = after_id = None
+    if cursor:
+        try:
+            after_timestamp, after_id = decode_cursor(cursor)
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+    
+    # Conecta antes de abrir a resposta: falhas viram erro HTTP, não um stream cortado
+    try:
+        await status_store.collection()
+    except MongoNotConfigured as e:
+        raise HTTPException(status_code=503, detail=str(e))
+    
+    async def ndjson_lines():
+        sent = 0
+        last = None
+        async for document in status_store.iter_page(limit, after_timestamp, after_id):
+            if sent == limit:
+                yield json.dumps({"next_cursor": encode_cursor(last.timestamp, last.id)}) + "\n"
+                break
+            # Sem validar o lote inteiro antes: cada documento sai assim que chega do Mongo
+            last = StatusCheck.model_construct(**document)
+            yield last.model_dump_json() + "\n"
+            sent += 1
+    
+    return StreamingResponse(ndjson_lines(), media_type="application/x-ndjson")
 
 # Google Cloud API Configuration (Admin only)
 @api_router.post("/admin/google-config", response_model=GoogleConfigResponse)
-async def create_google_config(config: GoogleConfigCreate, db_session: Session = Depends(get_db)):
+def create_google_config(config: GoogleConfigCreate, db_session: Session = Depends(get_db)):
     # Desativar configuração anterior
     db_session.query(GoogleConfig).filter(GoogleConfig.is_active == True).update({'is_active': False})
     
@@ -239,13 +424,15 @@ async def create_google_config(config: GoogleConfigCreate, db_session: Session =
     )
     
     db_session.add(new_config)
+    bump_config_version(db_session)
     db_session.commit()
     db_session.refresh(new_config)
+    config_store.reload()
     
     return new_config
 
 @api_router.get("/admin/google-config", response_model=Optional[GoogleConfigResponse])
-async def get_google_config(db_session: Session = Depends(get_db)):
+def get_google_config(db_session: Session = Depends(get_db)):
     config = db_session.query(GoogleConfig).filter(GoogleConfig.is_active == True).first()
     return config
 
@@ -271,7 +458,7 @@ async def get_google_redirect_uris():
 
 # Client Management
 @api_router.post("/admin/clients", response_model=ClientResponse)
-async def create_client(client_data: ClientCreate, db_session: Session = Depends(get_db)):
+def create_client(client_data: ClientCreate, db_session: Session = Depends(get_db)):
     new_client = Client(
         id=str(uuid.uuid4()),
         name=client_data.name,
@@ -282,6 +469,7 @@ async def create_client(client_data: ClientCreate, db_session: Session = Depends
     )
     
     db_session.add(new_client)
+    bump_counters(db_session, total_clients=1, pending_payments=1)
     
     # Criar notificação
     notification = Notification(
@@ -299,33 +487,120 @@ async def create_client(client_data: ClientCreate, db_session: Session = Depends
     return new_client
 
 @api_router.get("/admin/clients", response_model=List[ClientResponse])
-async def get_all_clients(db_session: Session = Depends(get_db)):
-    clients = db_session.query(Client).all()
+async def get_all_clients(
+    response: Response,
+    cursor: Optional[str] = None,
+    limit: int = Query(CLIENT_LIST_DEFAULT_LIMIT, ge=1, le=CLIENT_LIST_MAX_LIMIT),
+    status: Optional[str] = None,
+    payment_status: Optional[str] = None,
+    enabled: Optional[bool] = None,
+    search: Optional[str] = Query(None, description="Prefixo do nome ou do e-mail"),
+    sort: str = 'created_at',
+    order: str = 'desc',
+    db_session: AsyncSession = Depends(get_async_db)
+):
+    """Clientes paginados por cursor; o cursor da próxima página vem no header X-Next-Cursor"""
+    sort_column = CLIENT_SORT_COLUMNS.get(sort)
+    if sort_column is None:
+        raise HTTPException(status_code=400, detail=f"Ordenação inválida, use uma de {list(CLIENT_SORT_COLUMNS)}")
+    if order not in ('asc', 'desc'):
+        raise HTTPException(status_code=400, detail="Direção inválida, use asc ou desc")
+    
+    query = select(Client)
+    if status:
+        query = query.where(Client.status == status)
+    if payment_status:
+        query = query.where(Client.payment_status == payment_status)
+    if enabled is not None:
+        query = query.where(Client.enabled == enabled)
+    if search:
+        query = query.where(
+            Client.name.startswith(search, autoescape=True) | Client.email.startswith(search, autoescape=True)
+        )
+    
+    # O cursor guarda a ordenação: trocar ?sort ou ?order exige começar da primeira página
+    sort_key = f"{sort}:{order}"
+    if cursor:
+        try:
+            after_value, after_id = decode_cursor(
+                cursor, sort_key, parse=datetime.fromisoformat if sort == 'created_at' else str
+            )
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+        if order == 'desc':
+            query = query.where((sort_column < after_value) | ((sort_column == after_value) & (Client.id < after_id)))
+        else:
+            query = query.where((sort_column > after_value) | ((sort_column == after_value) & (Client.id > after_id)))
+    
+    if order == 'desc':
+        query = query.order_by(sort_column.desc(), Client.id.desc())
+    else:
+        query = query.order_by(sort_column.asc(), Client.id.asc())
+    
+    rows = (await db_session.execute(query.limit(limit + 1))).scalars().all()
+    clients = rows[:limit]
+    if len(rows) > limit:
+        last = clients[-1]
+        response.headers["X-Next-Cursor"] = encode_cursor(getattr(last, sort), last.id, sort_key)
     return clients
 
 @api_router.get("/clients/{client_id}", response_model=ClientResponse)
-async def get_client(client_id: str, db_session: Session = Depends(get_db)):
-    client = db_session.query(Client).filter(Client.id == client_id).first()
+async def get_client(client_id: str, db_session: AsyncSession = Depends(get_async_db)):
+    client = await db_session.get(Client, client_id)
     if not client:
         raise HTTPException(status_code=404, detail="Cliente não encontrado")
     return client
 
 # Site Colors Management (Admin only)
+async def load_site_colors() -> Optional[CachedSiteColors]:
+    """Lê as cores ativas e já deixa as duas representações prontas"""
+    async with AsyncSessionLocal() as db_session:
+        colors = (await db_session.execute(
+            select(SiteColors).where(SiteColors.is_active == True).limit(1)
+        )).scalar_one_or_none()
+    if not colors:
+        return None
+    return CachedSiteColors(
+        etag=colors_version(colors),
+        json_body=SiteColorsResponse.model_validate(colors).model_dump_json().encode(),
+        css_body=render_css(colors).encode(),
+        loaded_at=time.monotonic()
+    )
+
+async def get_cached_site_colors() -> Optional[CachedSiteColors]:
+    # Com o cache válido, nem consulta o banco
+    return site_colors_cache.peek() or await site_colors_cache.get_async(load_site_colors)
+
+def site_colors_response(entry: CachedSiteColors, representation: str, body: bytes, media_type: str,
+                         if_none_match: Optional[str]) -> Response:
+    """Resposta com ETag forte por representação; 304 se o navegador já tem esta versão"""
+    etag = f'"{entry.etag}-{representation}"'
+    headers = {"ETag": etag, "Cache-Control": SITE_COLORS_CACHE_CONTROL}
+    if if_none_match:
+        client_etags = {tag.strip().removeprefix('W/') for tag in if_none_match.split(',')}
+        if etag in client_etags or '*' in client_etags:
+            return Response(status_code=304, headers=headers)
+    return Response(content=body, media_type=media_type, headers=headers)
+
 @api_router.get("/admin/site-colors", response_model=Optional[SiteColorsResponse])
-async def get_site_colors(db_session: Session = Depends(get_db)):
+async def get_site_colors(if_none_match: Optional[str] = Header(None)):
     """Obter as cores ativas do site"""
-    colors = db_session.query(SiteColors).filter(SiteColors.is_active == True).first()
-    if not colors:
-        # Se não existir, criar com cores padrão
-        default_colors = SiteColors()
-        db_session.add(default_colors)
-        db_session.commit()
-        db_session.refresh(default_colors)
-        return default_colors
-    return colors
+    entry = await get_cached_site_colors()
+    if entry is None:
+        return JSONResponse(content=None, headers={"Cache-Control": "no-cache"})
+    return site_colors_response(entry, 'json', entry.json_body, 'application/json', if_none_match)
+
+@api_router.get("/site-colors.css")
+async def get_site_colors_stylesheet(if_none_match: Optional[str] = Header(None)):
+    """Cores ativas do site como variáveis CSS (--color-*), para usar num <link rel="stylesheet">"""
+    entry = await get_cached_site_colors()
+    if entry is None:
+        return Response(content=render_css(SiteColorsCreate()), media_type="text/css",
+                        headers={"Cache-Control": "no-cache"})
+    return site_colors_response(entry, 'css', entry.css_body, 'text/css; charset=utf-8', if_none_match)
 
 @api_router.post("/admin/site-colors", response_model=SiteColorsResponse)
-async def save_site_colors(colors_data: SiteColorsCreate, db_session: Session = Depends(get_db)):
+def save_site_colors(colors_data: SiteColorsCreate, db_session: Session = Depends(get_db)):
     """Salvar as cores do site"""
     # Desativar configurações anteriores
     db_session.query(SiteColors).update({"is_active": False})
@@ -335,11 +610,12 @@ async def save_site_colors(colors_data: SiteColorsCreate, db_session: Session =
     db_session.add(new_colors)
     db_session.commit()
     db_session.refresh(new_colors)
+    site_colors_cache.invalidate()
     
     return new_colors
 
 @api_router.put("/admin/site-colors/{colors_id}", response_model=SiteColorsResponse)
-async def update_site_colors(colors_id: str, colors_data: SiteColorsCreate, db_session: Session = Depends(get_db)):
+def update_site_colors(colors_id: str, colors_data: SiteColorsCreate, db_session: Session = Depends(get_db)):
     """Atualizar cores existentes"""
     colors = db_session.query(SiteColors).filter(SiteColors.id == colors_id).first()
     if not colors:
@@ -354,25 +630,28 @@ async def update_site_colors(colors_id: str, colors_data: SiteColorsCreate, db_s
     
     db_session.commit()
     db_session.refresh(colors)
+    site_colors_cache.invalidate()
     
     return colors
 
 # System Settings Management (Admin only)
 @api_router.get("/admin/system-settings", response_model=Optional[SystemSettingsResponse])
-async def get_system_settings(db_session: Session = Depends(get_db)):
+def get_system_settings(db_session: Session = Depends(get_db)):
     """Obter as configurações ativas do sistema"""
     settings = db_session.query(SystemSettings).filter(SystemSettings.is_active == True).first()
     if not settings:
         # Se não existir, criar com configurações padrão
         default_settings = SystemSettings()
         db_session.add(default_settings)
+        bump_config_version(db_session)
         db_session.commit()
         db_session.refresh(default_settings)
+        config_store.reload()
         return default_settings
     return settings
 
 @api_router.post("/admin/system-settings", response_model=SystemSettingsResponse)
-async def save_system_settings(settings_data: SystemSettingsCreate, db_session: Session = Depends(get_db)):
+def save_system_settings(settings_data: SystemSettingsCreate, db_session: Session = Depends(get_db)):
     """Salvar as configurações do sistema"""
     # Desativar configurações anteriores
     db_session.query(SystemSettings).update({"is_active": False})
@@ -380,18 +659,25 @@ async def save_system_settings(settings_data: SystemSettingsCreate, db_session:
     # Criar nova configuração
     new_settings = SystemSettings(**settings_data.dict(), is_active=True)
     db_session.add(new_settings)
+    bump_config_version(db_session)
     db_session.commit()
     db_session.refresh(new_settings)
+    config_store.reload()
+    
+    # Vencimento de todos os álbuns recalculado com o novo prazo
+    album_expiry_sweeper.recompute(db_session, new_settings.album_expiry_days)
     
     return new_settings
 
 @api_router.put("/admin/system-settings/{settings_id}", response_model=SystemSettingsResponse)
-async def update_system_settings(settings_id: str, settings_data: SystemSettingsCreate, db_session: Session = Depends(get_db)):
+def update_system_settings(settings_id: str, settings_data: SystemSettingsCreate, db_session: Session = Depends(get_db)):
     """Atualizar configurações existentes"""
     settings = db_session.query(SystemSettings).filter(SystemSettings.id == settings_id).first()
     if not settings:
         raise HTTPException(status_code=404, detail="Configurações não encontradas")
     
+    old_expiry_days = settings.album_expiry_days
+    
     # Atualizar campos
     for field, value in settings_data.dict().items():
         setattr(settings, field, value)
@@ -399,32 +685,68 @@ async def update_system_settings(settings_id: str, settings_data: SystemSettings
     from datetime import datetime
     settings.updated_at = datetime.utcnow()
     
+    bump_config_version(db_session)
     db_session.commit()
     db_session.refresh(settings)
+    config_store.reload()
+    
+    if settings.is_active and settings.album_expiry_days != old_expiry_days:
+        album_expiry_sweeper.recompute(db_session, settings.album_expiry_days)
     
     return settings
 
 # Dashboard Statistics (Admin only)
 @api_router.get("/admin/dashboard-stats")
-async def get_dashboard_stats(db_session: Session = Depends(get_db)):
+async def get_dashboard_stats(db_session: AsyncSession = Depends(get_async_db)):
     """Obter estatísticas para o dashboard administrativo"""
-    total_clients = db_session.query(Client).count()
-    active_albums = db_session.query(Album).filter(Album.status == 'active').count()
-    expired_albums = db_session.query(Album).filter(Album.status == 'expired').count()
-    total_uploads = 0  # TODO: Implementar quando tiver tabela de uploads
-    pending_payments = db_session.query(Client).filter(Client.status == 'pending').count()
+    # Uma linha só, mantida pelas próprias escritas e reconciliada em segundo plano
+    counters = await db_session.get(DashboardCounters, COUNTERS_ROW_ID)
+    if counters is None:
+        counters = await db_session.run_sync(read_counters)
     
     return {
-        "total_clients": total_clients,
-        "active_albums": active_albums,
-        "expired_albums": expired_albums,
-        "total_uploads": total_uploads,
-        "pending_payments": pending_payments
+        "total_clients": counters.total_clients,
+        "active_albums": counters.active_albums,
+        "expired_albums": counters.expired_albums,
+        "total_uploads": counters.total_uploads,
+        "total_bytes": counters.total_bytes,
+        "pending_payments": counters.pending_payments,
+        "updated_at": counters.updated_at,
+        "reconciled_at": counters.reconciled_at
     }
 
+@api_router.get("/admin/storage")
+def get_platform_storage(db_session: Session = Depends(get_db)):
+    """Armazenamento de todos os álbuns: bytes e quantidade por tipo e por dia"""
+    return get_storage_rollup(db_session)
+
+@api_router.get("/admin/album-expiry/metrics")
+async def get_album_expiry_metrics():
+    """Resultado das últimas varreduras e recálculos de vencimento (linhas alteradas e duração)"""
+    return album_expiry_sweeper.metrics
+
+@api_router.get("/admin/db-pool/metrics")
+async def get_db_pool_metrics(reset: bool = False):
+    """Ocupação dos pools de conexão deste processo e histograma de espera no checkout"""
+    metrics = {'sync': sync_pool_metrics.snapshot(), 'async': async_pool_metrics.snapshot()}
+    if reset:
+        sync_pool_metrics.reset()
+        async_pool_metrics.reset()
+    return metrics
+
+@api_router.post("/admin/album-expiry/sweep")
+def run_album_expiry_sweep():
+    """Executa agora a varredura de álbuns vencidos"""
+    return album_expiry_sweeper.sweep()
+
+@api_router.get("/admin/token-refresher/metrics")
+async def get_token_refresher_metrics():
+    """Contadores do refresher de tokens do Google (renovados e falhas)"""
+    return token_refresher.metrics
+
 # Album Management
 @api_router.post("/clients/{client_id}/albums", response_model=AlbumResponse)
-async def create_album(client_id: str, album_data: AlbumCreate, db_session: Session = Depends(get_db)):
+def create_album(client_id: str, album_data: AlbumCreate, db_session: Session = Depends(get_db)):
     client = db_session.query(Client).filter(Client.id == client_id).first()
     if not client:
         raise HTTPException(status_code=404, detail="Cliente não encontrado")
@@ -449,18 +771,49 @@ async def create_album(client_id: str, album_data: AlbumCreate, db_session: Sess
     update_album_expiry(new_album, db_session)
     
     db_session.add(new_album)
+    bump_album_status(db_session, None, new_album.status)
     db_session.commit()
     db_session.refresh(new_album)
     
     return new_album
 
 @api_router.get("/clients/{client_id}/albums", response_model=List[AlbumResponse])
-async def get_client_albums(client_id: str, db_session: Session = Depends(get_db)):
-    albums = db_session.query(Album).filter(Album.client_id == client_id).all()
-    return albums
+async def get_client_albums(client_id: str, db_session: AsyncSession = Depends(get_async_db)):
+    result = await db_session.execute(select(Album).where(Album.client_id == client_id))
+    return result.scalars().all()
+
+@api_router.get("/clients/{client_id}/dashboard", response_model=ClientDashboardResponse)
+async def get_client_dashboard(client_id: str, db_session: AsyncSession = Depends(get_async_db)):
+    """Tudo que o painel do cliente precisa numa requisição: cliente, álbuns, Google Drive e notificações não lidas"""
+    # 1ª consulta: cliente + álbuns + token ativo num JOIN (sem as colunas LONGTEXT do token)
+    # 2ª consulta: notificações não lidas, via IN pelo id do cliente
+    query = select(Client).where(Client.id == client_id).options(
+        joinedload(Client.albums),
+        joinedload(Client.google_tokens.and_(GoogleToken.is_active == True)).load_only(
+            GoogleToken.google_email, GoogleToken.expires_at, GoogleToken.created_at
+        ),
+        selectinload(Client.notifications.and_(Notification.read == False))
+    )
+    client = (await db_session.execute(query)).unique().scalar_one_or_none()
+    if not client:
+        raise HTTPException(status_code=404, detail="Cliente não encontrado")
+    
+    token = max(client.google_tokens, key=lambda token: token.created_at or datetime.min, default=None)
+    return {
+        "client": client,
+        "albums": sorted(client.albums, key=lambda album: album.created_at or datetime.min),
+        "google": {
+            "connected": token is not None,
+            "email": token.google_email if token else None,
+            "expires_at": token.expires_at if token else None
+        },
+        "unread_notifications": sorted(
+            client.notifications, key=lambda notification: notification.created_at or datetime.min, reverse=True
+        )
+    }
 
 @api_router.put("/clients/{client_id}/albums/{album_id}", response_model=AlbumResponse)
-async def update_album(client_id: str, album_id: str, album_data: AlbumUpdate, db_session: Session = Depends(get_db)):
+def update_album(client_id: str, album_id: str, album_data: AlbumUpdate, db_session: Session = Depends(get_db)):
     album = db_session.query(Album).filter(
         Album.id == album_id,
         Album.client_id == client_id
@@ -469,26 +822,32 @@ async def update_album(client_id: str, album_id: str, album_data: AlbumUpdate, d
     if not album:
         raise HTTPException(status_code=404, detail="Álbum não encontrado")
     
-    # Salvar data do evento anterior para verificar se mudou
+    # Salvar data do evento e status anteriores para verificar se mudaram
     old_event_date = album.event_date
+    old_status = album.status
     
     # Atualizar campos fornecidos
-    for field, value in album_data.dict(exclude_unset=True).items():
+    updates = album_data.dict(exclude_unset=True)
+    for field, value in updates.items():
         setattr(album, field, value)
     
     # Se a data do evento mudou, recalcular o vencimento
     if album.event_date != old_event_date:
         update_album_expiry(album, db_session)
     
+    bump_album_status(db_session, old_status, album.status)
     album.updated_at = datetime.utcnow()
     db_session.commit()
     db_session.refresh(album)
     
+    if 'google_folder_id' in updates:
+        invalidate_album_folder(album_id)
+    
     return album
 
 # Google Drive Integration
 @api_router.get("/auth/google/authorize/{client_id}")
-async def google_authorize(client_id: str, db_session: Session = Depends(get_db)):
+def google_authorize(client_id: str, db_session: Session = Depends(get_db)):
     client = db_session.query(Client).filter(Client.id == client_id).first()
     if not client:
         raise HTTPException(status_code=404, detail="Cliente não encontrado")
@@ -515,7 +874,7 @@ async def google_callback(code: str, state: str, db_session: Session = Depends(g
         base_url = os.environ.get('REACT_APP_BACKEND_URL', 'https://43176524-faa8-4080-8ac0-2263718744a5.preview.emergentagent.com')
         redirect_uri = f"{base_url}/api/auth/google/callback"
         
-        token = drive_service.handle_oauth_callback(code, state, redirect_uri)
+        token = await run_in_drive_pool(drive_service.handle_oauth_callback, code, state, redirect_uri)
         
         # Extrair client_id do state
         client_id = state.replace('client_id:', '')
@@ -561,7 +920,7 @@ async def google_callback(code: str, state: str, db_session: Session = Depends(g
         raise HTTPException(status_code=400, detail=str(e))
 
 @api_router.get("/clients/{client_id}/google-status")
-async def get_google_status(client_id: str, db_session: Session = Depends(get_db)):
+def get_google_status(client_id: str, db_session: Session = Depends(get_db)):
     """Verifica se o cliente tem Google Drive conectado"""
     token = db_session.query(GoogleToken).filter(
         GoogleToken.client_id == client_id,
@@ -582,7 +941,7 @@ async def get_google_status(client_id: str, db_session: Session = Depends(get_db
         }
 
 @api_router.delete("/clients/{client_id}/google-connection")
-async def disconnect_google(client_id: str, db_session: Session = Depends(get_db)):
+def disconnect_google(client_id: str, db_session: Session = Depends(get_db)):
     drive_service = GoogleDriveService(db_session)
     success = drive_service.disconnect_client(client_id)
     
@@ -603,14 +962,12 @@ async def test_upload(
     try:
         drive_service = GoogleDriveService(db_session)
         
-        # Ler conteúdo do arquivo
-        file_content = await file.read()
-        
-        # Fazer upload para Google Drive
-        google_file_id = drive_service.upload_file(
+        # Enviar o arquivo temporário recebido direto ao Drive, em blocos
+        google_file_id = await run_in_drive_pool(
+            drive_service.upload_file,
             client_id,
             folder_id,
-            file_content,
+            file.file,
             file.filename,
             file.content_type
         )
@@ -630,6 +987,112 @@ async def test_upload(
         raise HTTPException(status_code=500, detail=f"Erro no upload: {str(e)}")
 
 # File Upload for guests
+def get_active_album(album_id: str, db_session: Session) -> Album:
+    """Busca o álbum e garante que ele aceita uploads"""
+    album = db_session.query(Album).filter(Album.id == album_id).first()
+    if not album:
+        raise HTTPException(status_code=404, detail="Álbum não encontrado")
+    
+    if album.status != 'active':
+        raise HTTPException(status_code=400, detail="Álbum não está ativo")
+    
+    return album
+
+def store_album_upload(album: Album, file: UploadFile, guest_name: str,
+                       comment: Optional[str], db_session: Session) -> Tuple[Upload, bool]:
+    """Envia o arquivo ao Drive e registra o upload (bloqueante, roda no pool do Drive)
+
+    Retorna o upload e se ele já existia no álbum (mesmo conteúdo, nada enviado ao Drive).
+    """
+    # O corpo da requisição já foi gravado em arquivo temporário pelo parser
+    # multipart: o hash é calculado lendo esse arquivo local antes de qualquer envio
+    content_hash = hash_stream(file.file)
+    # Envios simultâneos do mesmo arquivo: o segundo espera o primeiro e o encontra como duplicado
+    with dedup_single_flight(album.id, content_hash):
+        duplicate = find_duplicate_upload(db_session, album.id, content_hash)
+        if duplicate:
+            return duplicate, True
+        
+        drive_service = GoogleDriveService(db_session)
+        
+        # Enviamos o arquivo temporário ao Drive em blocos, sem carregá-lo inteiro
+        folder_id = drive_service.resolve_album_folder(album.id)
+        google_file_id, original_size, stored_size = push_to_drive(
+            drive_service,
+            album,
+            folder_id,
+            file.file,
+            file.filename,
+            file.content_type
+        )
+        
+        if not google_file_id:
+            raise HTTPException(status_code=500, detail="Falha no upload para Google Drive")
+        
+        # Registrar upload no banco; sem a linha o arquivo ficaria órfão no Drive
+        try:
+            upload_record, duplicate = save_new_upload(db_session, Upload(
+                id=str(uuid.uuid4()),
+                album_id=album.id,
+                filename=file.filename,
+                google_file_id=google_file_id,
+                uploaded_by=guest_name,
+                upload_comment=comment,
+                file_size=f"{stored_size / (1024*1024):.2f} MB",
+                original_size_bytes=original_size,
+                size_bytes=stored_size,
+                mime_type=file.content_type,
+                content_hash=content_hash,
+                status='stored'
+            ))
+        except Exception:
+            drive_service.delete_file(album.client_id, google_file_id)
+            raise
+    
+    if duplicate:
+        # Outro worker gravou o mesmo conteúdo durante o nosso envio: a cópia dele fica
+        drive_service.delete_file(album.client_id, google_file_id)
+        return upload_record, True
+    
+    if is_image(file.content_type):
+        thumbnail_pipeline.submit(upload_record.id, thumbnail_pipeline.stage_stream(file.file))
+    
+    return upload_record, False
+
+def spool_album_upload(album: Album, file: UploadFile, guest_name: str,
+                       comment: Optional[str], db_session: Session) -> Tuple[Upload, bool]:
+    """Grava o arquivo no spool local e registra o upload como pendente
+
+    Se o mesmo conteúdo já foi recebido pelo álbum, descarta a cópia e retorna o existente.
+    """
+    upload_id = str(uuid.uuid4())
+    spool_path, file_size, content_hash = upload_spool.write(upload_id, file.file)
+    
+    with dedup_single_flight(album.id, content_hash):
+        duplicate = find_duplicate_upload(db_session, album.id, content_hash, ('stored', 'pending'))
+        if not duplicate:
+            upload_record, is_duplicate = save_new_upload(db_session, Upload(
+                id=upload_id,
+                album_id=album.id,
+                filename=file.filename,
+                uploaded_by=guest_name,
+                upload_comment=comment,
+                file_size=f"{file_size / (1024*1024):.2f} MB",
+                original_size_bytes=file_size,
+                size_bytes=file_size,
+                mime_type=file.content_type,
+                status='pending',
+                spool_path=spool_path,
+                content_hash=content_hash,
+                attempts=0
+            ))
+            if not is_duplicate:
+                return upload_record, False
+            duplicate = upload_record
+    
+    upload_spool.discard(spool_path)
+    return duplicate, True
+
 @api_router.post("/albums/{album_id}/upload")
 async def upload_file_to_album(
     album_id: str,
@@ -638,52 +1101,559 @@ async def upload_file_to_album(
     comment: Optional[str] = Form(None),
     db_session: Session = Depends(get_db)
 ):
-    album = db_session.query(Album).filter(Album.id == album_id).first()
-    if not album:
+    # Sessão síncrona, fora do event loop: é a mesma conexão que o envio ao Drive vai usar,
+    # em vez de segurar uma segunda do pool assíncrono durante todo o upload
+    album = await run_in_threadpool(get_active_album, album_id, db_session)
+    
+    if UPLOAD_INGEST_MODE == 'spool':
+        try:
+            upload_record, duplicate = await run_in_threadpool(
+                spool_album_upload, album, file, guest_name, comment, db_session
+            )
+        except Exception as e:
+            raise HTTPException(status_code=500, detail=f"Erro no upload: {str(e)}")
+        
+        if not duplicate:
+            upload_spool.enqueue(upload_record.id)
+        return JSONResponse(status_code=200 if duplicate else 202, content={
+            "message": "Arquivo já enviado a este álbum" if duplicate else "Upload recebido, enviando para o Google Drive",
+            "upload_id": upload_record.id,
+            "status": upload_record.status,
+            "file_id": upload_record.google_file_id,
+            "duplicate": duplicate
+        })
+    
+    try:
+        upload_record, duplicate = await run_in_drive_pool(
+            store_album_upload, album, file, guest_name, comment, db_session
+        )
+        
+        return {
+            "message": "Arquivo já enviado a este álbum" if duplicate else "Upload realizado com sucesso",
+            "file_id": upload_record.google_file_id,
+            "upload_id": upload_record.id,
+            "duplicate": duplicate
+        }
+        
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Erro no upload: {str(e)}")
+
+@api_router.get("/albums/{album_id}/uploads/{upload_id}/status", response_model=UploadStatusResponse)
+async def get_upload_status(album_id: str, upload_id: str, db_session: AsyncSession = Depends(get_async_db)):
+    """Situação de um upload: pending, stored ou failed"""
+    upload = await db_session.get(Upload, upload_id)
+    if not upload or upload.album_id != album_id:
+        raise HTTPException(status_code=404, detail="Upload não encontrado")
+    return upload
+
+@api_router.get("/albums/{album_id}/storage")
+def get_album_storage(album_id: str, db_session: Session = Depends(get_db)):
+    """Armazenamento do álbum: bytes e quantidade por tipo e por dia"""
+    if not db_session.query(Album.id).filter(Album.id == album_id).first():
+        raise HTTPException(status_code=404, detail="Álbum não encontrado")
+    return get_storage_rollup(db_session, album_id)
+
+@api_router.get("/uploads/{album_id}", response_model=UploadListResponse)
+async def list_album_uploads(
+    album_id: str,
+    cursor: Optional[str] = None,
+    limit: int = Query(UPLOAD_LIST_DEFAULT_LIMIT, ge=1, le=UPLOAD_LIST_MAX_LIMIT),
+    mime_type: Optional[str] = Query(None, description="Prefixo, ex.: image/ ou video/"),
+    uploaded_by: Optional[str] = None,
+    db_session: AsyncSession = Depends(get_async_db)
+):
+    """Uploads do álbum, mais recentes primeiro, paginados por cursor"""
+    if not await db_session.get(Album, album_id):
         raise HTTPException(status_code=404, detail="Álbum não encontrado")
     
-    if album.status != 'active':
-        raise HTTPException(status_code=400, detail="Álbum não está ativo")
+    query = select(Upload).where(
+        Upload.album_id == album_id,
+        Upload.status == 'stored',
+        Upload.uploaded_at != None
+    )
+    if mime_type:
+        query = query.where(Upload.mime_type.startswith(mime_type, autoescape=True))
+    if uploaded_by:
+        query = query.where(Upload.uploaded_by == uploaded_by)
+    
+    if cursor:
+        try:
+            after_uploaded_at, after_id = decode_cursor(cursor)
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+        # Condição expandida (em vez de comparar tuplas) para o MariaDB usar o índice
+        query = query.where(
+            (Upload.uploaded_at < after_uploaded_at) |
+            ((Upload.uploaded_at == after_uploaded_at) & (Upload.id < after_id))
+        )
+    
+    result = await db_session.execute(
+        query.order_by(Upload.uploaded_at.desc(), Upload.id.desc()).limit(limit + 1)
+    )
+    rows = result.scalars().all()
+    uploads = rows[:limit]
+    next_cursor = None
+    if len(rows) > limit:
+        next_cursor = encode_cursor(uploads[-1].uploaded_at, uploads[-1].id)
     
+    return {"uploads": uploads, "next_cursor": next_cursor}
+
+# Batch uploads
+def get_album_upload_semaphore(album_id: str) -> asyncio.Semaphore:
+    semaphore = _album_upload_semaphores.get(album_id)
+    if semaphore is None:
+        semaphore = asyncio.Semaphore(BATCH_UPLOAD_CONCURRENCY)
+        _album_upload_semaphores[album_id] = semaphore
+    return semaphore
+
+def get_album_drive_target(album: Album, db_session: Session):
+    """Credenciais e pasta do álbum no Drive, resolvidas uma vez para o lote todo"""
     drive_service = GoogleDriveService(db_session)
+    credentials = drive_service.get_client_credentials(album.client_id)
+    if not credentials:
+        raise HTTPException(status_code=400, detail="Cliente não tem Google Drive conectado")
     
     try:
-        # Ler conteúdo do arquivo
-        file_content = await file.read()
+        folder_id = drive_service.resolve_album_folder(album.id, credentials)
+    except ValueError as e:
+        raise HTTPException(status_code=500, detail=str(e))
+    
+    return credentials, folder_id
+
+def find_existing_hashes(album_id: str, content_hashes: set, db_session: Session) -> dict:
+    """Uploads já gravados no álbum para cada hash (o mais antigo por hash)"""
+    uploads = db_session.query(Upload).filter(
+        Upload.album_id == album_id,
+        Upload.content_hash.in_(content_hashes),
+        Upload.status == 'stored'
+    ).order_by(Upload.uploaded_at.desc()).all()
+    return {upload.content_hash: upload for upload in uploads}
+
+def push_batch_file(album: Album, folder_id: str, credentials, drive_service: GoogleDriveService,
+                    file: UploadFile, content_hash: str, guest_name: str,
+                    comment: Optional[str]) -> Tuple[Upload, bool]:
+    """Envia um arquivo do lote e grava o upload dele (bloqueante, roda no pool do Drive)
+
+    Sessões curtas antes e depois do envio: nenhuma conexão fica presa durante o upload.
+    Retorna o upload e se ele já existia no álbum.
+    """
+    with dedup_single_flight(album.id, content_hash):
+        db = SessionLocal()
+        try:
+            duplicate = find_duplicate_upload(db, album.id, content_hash)
+        finally:
+            db.close()
+        if duplicate:
+            return duplicate, True
         
-        # Fazer upload para Google Drive
-        folder_id = album.google_folder_id
-        google_file_id = drive_service.upload_file(
-            album.client_id,
+        google_file_id, original_size, stored_size = push_to_drive(
+            drive_service,
+            album,
             folder_id,
-            file_content,
+            file.file,
             file.filename,
-            file.content_type
+            file.content_type,
+            credentials
         )
-        
         if not google_file_id:
-            raise HTTPException(status_code=500, detail="Falha no upload para Google Drive")
-        
-        # Registrar upload no banco
-        from database import Upload
-        upload_record = Upload(
-            id=str(uuid.uuid4()),
-            album_id=album_id,
-            filename=file.filename,
-            google_file_id=google_file_id,
-            uploaded_by=guest_name,
-            upload_comment=comment,
-            file_size=f"{len(file_content) / (1024*1024):.2f} MB",
-            mime_type=file.content_type
-        )
-        
-        db_session.add(upload_record)
-        db_session.commit()
+            raise ValueError("Falha no upload para Google Drive")
         
-        return {"message": "Upload realizado com sucesso", "file_id": google_file_id}
+        db = SessionLocal()
+        try:
+            upload_record, duplicate = save_new_upload(db, Upload(
+                id=str(uuid.uuid4()),
+                album_id=album.id,
+                filename=file.filename,
+                google_file_id=google_file_id,
+                uploaded_by=guest_name,
+                upload_comment=comment,
+                file_size=f"{stored_size / (1024*1024):.2f} MB",
+                original_size_bytes=original_size,
+                size_bytes=stored_size,
+                mime_type=file.content_type,
+                content_hash=content_hash,
+                status='stored'
+            ))
+            db.refresh(upload_record)
+        except Exception:
+            # Sem a linha no banco o arquivo ficaria órfão no Drive
+            drive_service.delete_file(album.client_id, google_file_id, credentials)
+            raise
+        finally:
+            db.close()
+    
+    if duplicate:
+        # Outro worker gravou o mesmo conteúdo durante o nosso envio: a cópia dele fica
+        drive_service.delete_file(album.client_id, google_file_id, credentials)
+    return upload_record, duplicate
+
+@api_router.post("/albums/{album_id}/uploads:batch")
+async def upload_files_batch(
+    album_id: str,
+    files: List[UploadFile] = File(...),
+    guest_name: str = Form(...),
+    comment: Optional[str] = Form(None),
+    db_session: Session = Depends(get_db)
+):
+    """Recebe vários arquivos numa requisição e envia ao Drive em paralelo (limitado por álbum)"""
+    if len(files) > BATCH_UPLOAD_MAX_FILES:
+        raise HTTPException(status_code=413, detail=f"Máximo de {BATCH_UPLOAD_MAX_FILES} arquivos por lote")
+    
+    album = await run_in_threadpool(get_active_album, album_id, db_session)
+    # Credenciais e pasta resolvidas uma vez: os envios paralelos não tocam na sessão do banco
+    credentials, folder_id = await run_in_drive_pool(get_album_drive_target, album, db_session)
+    drive_service = GoogleDriveService(db_session)
+    semaphore = get_album_upload_semaphore(album_id)
+    
+    # Hash de todos os arquivos e uma única consulta pelos conteúdos já presentes no álbum
+    hashes = await asyncio.gather(*(run_in_drive_pool(hash_stream, file.file) for file in files))
+    existing = await run_in_threadpool(find_existing_hashes, album_id, set(hashes), db_session)
+    
+    async def push(index: int):
+        async with semaphore:
+            try:
+                upload_record, duplicate = await run_in_drive_pool(
+                    push_batch_file,
+                    album,
+                    folder_id,
+                    credentials,
+                    drive_service,
+                    files[index],
+                    hashes[index],
+                    guest_name,
+                    comment
+                )
+                return upload_record, duplicate, None
+            except Exception as e:
+                return None, False, str(e)
+    
+    # Arquivos repetidos dentro do próprio lote são enviados uma vez só
+    first_by_hash = {}
+    for index, content_hash in enumerate(hashes):
+        if content_hash not in existing:
+            first_by_hash.setdefault(content_hash, index)
+    to_push = sorted(first_by_hash.values())
+    pushed = dict(zip(to_push, await asyncio.gather(*(push(index) for index in to_push))))
+    
+    stored_files = []
+    results = []
+    for index, (file, content_hash) in enumerate(zip(files, hashes)):
+        if content_hash in existing:
+            upload_record, duplicate = existing[content_hash], True
+        else:
+            upload_record, duplicate, error = pushed[first_by_hash[content_hash]]
+            if error:
+                results.append({"filename": file.filename, "success": False, "error": error})
+                continue
+            # Repetição dentro do lote aponta para o upload do primeiro arquivo igual
+            duplicate = duplicate or first_by_hash[content_hash] != index
         
+        results.append({
+            "filename": file.filename,
+            "success": True,
+            "upload_id": upload_record.id,
+            "file_id": upload_record.google_file_id,
+            "duplicate": duplicate
+        })
+        if not duplicate:
+            stored_files.append((upload_record, file))
+    
+    for record, file in stored_files:
+        if is_image(record.mime_type):
+            staged_path = await run_in_threadpool(thumbnail_pipeline.stage_stream, file.file)
+            thumbnail_pipeline.submit(record.id, staged_path)
+    
+    failed = sum(1 for result in results if not result["success"])
+    return {
+        "uploaded": len(stored_files),
+        "duplicates": len(results) - len(stored_files) - failed,
+        "failed": failed,
+        "results": results
+    }
+
+# Direct-to-Drive uploads (o navegador envia os bytes direto ao Google Drive)
+def open_direct_upload(album_id: str, upload_data: DirectUploadCreate, origin: Optional[str],
+                       db_session: Session) -> dict:
+    """Abre a sessão resumível do Drive na pasta do álbum (bloqueante)"""
+    album = get_active_album(album_id, db_session)
+    
+    drive_service = GoogleDriveService(db_session)
+    try:
+        folder_id = drive_service.resolve_album_folder(album.id)
+        session_url = drive_service.create_resumable_upload_session(
+            album.client_id,
+            folder_id,
+            upload_data.filename,
+            upload_data.mime_type,
+            upload_data.size,
+            origin
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    
+    return {"session_url": session_url, "folder_id": folder_id}
+
+def complete_direct_upload(album_id: str, completion: DirectUploadComplete, db_session: Session) -> Upload:
+    """Confere o arquivo no Drive e registra o upload (idempotente)"""
+    album = get_active_album(album_id, db_session)
+    
+    existing = db_session.query(Upload).filter(
+        Upload.album_id == album_id,
+        Upload.google_file_id == completion.google_file_id
+    ).first()
+    if existing:
+        return existing
+    
+    drive_service = GoogleDriveService(db_session)
+    try:
+        metadata = drive_service.get_file_metadata(album.client_id, completion.google_file_id)
     except Exception as e:
-        raise HTTPException(status_code=500, detail=f"Erro no upload: {str(e)}")
+        raise HTTPException(status_code=400, detail=f"Arquivo não encontrado no Google Drive: {str(e)}")
+    
+    # Só aceitar arquivos que realmente estão na pasta do álbum
+    if drive_service.resolve_album_folder(album.id) not in metadata.get('parents', []):
+        raise HTTPException(status_code=400, detail="Arquivo não pertence à pasta do álbum")
+    
+    file_size = int(metadata.get('size') or 0)
+    upload_record = Upload(
+        id=str(uuid.uuid4()),
+        album_id=album_id,
+        filename=metadata.get('name'),
+        google_file_id=completion.google_file_id,
+        uploaded_by=completion.guest_name,
+        upload_comment=completion.comment,
+        file_size=f"{file_size / (1024*1024):.2f} MB",
+        original_size_bytes=file_size,
+        size_bytes=file_size,
+        mime_type=metadata.get('mimeType'),
+        status='stored'
+    )
+    
+    db_session.add(upload_record)
+    bump_stored_uploads(db_session, 1, file_size)
+    db_session.commit()
+    db_session.refresh(upload_record)
+    
+    return upload_record
+
+@api_router.post("/albums/{album_id}/direct-uploads")
+async def create_direct_upload(
+    album_id: str,
+    upload_data: DirectUploadCreate,
+    origin: Optional[str] = Header(None),
+    db_session: Session = Depends(get_db)
+):
+    """Retorna a URL de sessão resumível para o navegador enviar o arquivo direto ao Drive"""
+    return await run_in_drive_pool(open_direct_upload, album_id, upload_data, origin, db_session)
+
+@api_router.post("/albums/{album_id}/direct-uploads/complete")
+async def finish_direct_upload(album_id: str, completion: DirectUploadComplete, db_session: Session = Depends(get_db)):
+    """Callback do navegador após o envio ao Drive: registra o upload"""
+    upload_record = await run_in_drive_pool(complete_direct_upload, album_id, completion, db_session)
+    return {
+        "message": "Upload realizado com sucesso",
+        "upload_id": upload_record.id,
+        "file_id": upload_record.google_file_id
+    }
+
+# Resumable chunked uploads
+@api_router.post("/albums/{album_id}/upload-sessions", response_model=UploadSessionResponse, status_code=201)
+def start_upload_session(album_id: str, session_data: UploadSessionCreate, db_session: Session = Depends(get_db)):
+    """Abre uma sessão de upload em partes"""
+    album = get_active_album(album_id, db_session)
+    return create_upload_session(
+        album,
+        session_data.filename,
+        session_data.mime_type,
+        session_data.total_size,
+        session_data.guest_name,
+        session_data.comment,
+        db_session
+    )
+
+@api_router.get("/albums/{album_id}/upload-sessions/{session_id}", response_model=UploadSessionResponse)
+def get_upload_session_status(album_id: str, session_id: str, db_session: Session = Depends(get_db)):
+    """Offset já confirmado: o cliente retoma o envio a partir dele"""
+    return get_upload_session(album_id, session_id, db_session)
+
+@api_router.put("/albums/{album_id}/upload-sessions/{session_id}")
+async def put_upload_session_chunk(
+    album_id: str,
+    session_id: str,
+    request: Request,
+    content_range: str = Header(...),
+    db_session: Session = Depends(get_db)
+):
+    """Recebe uma faixa de bytes (Content-Range: bytes início-fim/total)"""
+    upload_session = await run_in_threadpool(get_upload_session, album_id, session_id, db_session)
+    if upload_session.status != 'open':
+        raise HTTPException(status_code=409, detail="Sessão de upload já finalizada")
+    
+    try:
+        start, end, total = parse_content_range(content_range)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    
+    if total != upload_session.total_size:
+        raise HTTPException(status_code=400, detail="Total do Content-Range não confere com a sessão")
+    
+    committed = upload_session.committed_offset
+    if start > committed:
+        # Lacuna: o cliente precisa reenviar a partir do offset confirmado
+        return JSONResponse(status_code=409, content={
+            "detail": "Bloco fora de ordem",
+            "committed_offset": committed
+        })
+    
+    if end < committed:
+        # Bloco reenviado que já estava gravado: nada a fazer
+        return {"committed_offset": committed, "complete": committed == total}
+    
+    length = end - start + 1
+    try:
+        written = await write_session_chunk(upload_session.id, start, length, request.stream())
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    
+    if written != length:
+        raise HTTPException(status_code=400, detail="Bloco incompleto, reenvie a partir do offset confirmado")
+    
+    committed = await run_in_threadpool(commit_session_offset, upload_session.id, start, end + 1, db_session)
+    return {"committed_offset": committed, "complete": committed == total}
+
+@api_router.post("/albums/{album_id}/upload-sessions/{session_id}/finalize")
+async def finalize_upload_session_route(album_id: str, session_id: str, db_session: Session = Depends(get_db)):
+    """Conclui a sessão e entrega o arquivo aos workers do spool"""
+    upload_session = await run_in_threadpool(get_upload_session, album_id, session_id, db_session)
+    upload_record = await run_in_threadpool(finalize_upload_session, upload_session, db_session)
+    
+    if upload_record.status == 'pending':
+        upload_spool.enqueue(upload_record.id)
+    
+    return JSONResponse(status_code=202, content={
+        "message": "Upload recebido, enviando para o Google Drive",
+        "upload_id": upload_record.id,
+        "status": upload_record.status
+    })
+
+# Thumbnails
+THUMBNAIL_CACHE_CONTROL = "public, max-age=31536000, immutable"
+
+def get_album_upload(album_id: str, upload_id: str, db_session: Session) -> Upload:
+    upload = db_session.query(Upload).filter(
+        Upload.id == upload_id,
+        Upload.album_id == album_id
+    ).first()
+    if not upload:
+        raise HTTPException(status_code=404, detail="Upload não encontrado")
+    return upload
+
+async def fetch_album_upload(album_id: str, upload_id: str, db: AsyncSession) -> Upload:
+    upload = await db.get(Upload, upload_id)
+    if not upload or upload.album_id != album_id:
+        raise HTTPException(status_code=404, detail="Upload não encontrado")
+    return upload
+
+@api_router.get("/albums/{album_id}/uploads/{upload_id}/thumb")
+async def get_upload_thumbnail(
+    album_id: str,
+    upload_id: str,
+    size: int = Query(THUMBNAIL_SIZES[1] if len(THUMBNAIL_SIZES) > 1 else THUMBNAIL_SIZES[0]),
+    if_none_match: Optional[str] = Header(None),
+    db_session: AsyncSession = Depends(get_async_db)
+):
+    """Miniatura JPEG de uma foto do álbum, com cache longo (o conteúdo nunca muda)"""
+    if size not in THUMBNAIL_SIZES:
+        raise HTTPException(status_code=400, detail=f"Tamanho inválido, use um de {list(THUMBNAIL_SIZES)}")
+    
+    upload = await fetch_album_upload(album_id, upload_id, db_session)
+    if not is_image(upload.mime_type):
+        raise HTTPException(status_code=404, detail="Upload não é uma imagem")
+    
+    # Chave do arquivo renderizado, não content_hash: nos recomprimidos os dois diferem
+    thumbnail_key = thumbnail_key_for(upload)
+    path = thumbnail_cache.lookup(thumbnail_key, size) if thumbnail_key else None
+    if path is None:
+        if upload.status != 'stored' or not upload.google_file_id:
+            raise HTTPException(status_code=404, detail="Miniatura ainda não disponível")
+        try:
+            thumbnail_key = await thumbnail_pipeline.render_from_drive(upload)
+        except Exception as e:
+            raise HTTPException(status_code=502, detail=f"Erro ao gerar miniatura: {str(e)}")
+        path = thumbnail_cache.lookup(thumbnail_key, size)
+        if path is None:
+            raise HTTPException(status_code=500, detail="Erro ao gerar miniatura")
+    
+    etag = f'"{thumbnail_key}-{size}"'
+    headers = {"Cache-Control": THUMBNAIL_CACHE_CONTROL, "ETag": etag}
+    if if_none_match == etag:
+        return Response(status_code=304, headers=headers)
+    
+    return FileResponse(path, media_type="image/jpeg", headers=headers)
+
+# Fotos quase iguais (hash perceptual)
+def describe_uploads(upload_ids: List[str], db_session: Session) -> dict:
+    """Dados dos uploads em uma consulta só, por id"""
+    uploads = db_session.query(Upload).filter(Upload.id.in_(upload_ids)).all() if upload_ids else []
+    return {
+        upload.id: {
+            "id": upload.id,
+            "filename": upload.filename,
+            "uploaded_by": upload.uploaded_by,
+            "uploaded_at": upload.uploaded_at.isoformat() if upload.uploaded_at else None,
+            "google_file_id": upload.google_file_id,
+            "size_bytes": upload.size_bytes
+        }
+        for upload in uploads
+    }
+
+@api_router.get("/albums/{album_id}/near-duplicates")
+def get_near_duplicates(
+    album_id: str,
+    max_distance: int = Query(PHASH_DEFAULT_MAX_DISTANCE, ge=0, le=PHASH_MAX_DISTANCE_LIMIT),
+    db_session: Session = Depends(get_db)
+):
+    """Grupos de fotos quase iguais do álbum, para o casal revisar antes de exportar"""
+    if not db_session.query(Album.id).filter(Album.id == album_id).first():
+        raise HTTPException(status_code=404, detail="Álbum não encontrado")
+    
+    clusters = phash_index.clusters(album_id, max_distance)
+    uploads = describe_uploads([upload_id for cluster in clusters for upload_id in cluster], db_session)
+    
+    results = []
+    for cluster in clusters:
+        members = sorted(
+            (uploads[upload_id] for upload_id in cluster if upload_id in uploads),
+            key=lambda upload: upload["uploaded_at"] or ""
+        )
+        if len(members) > 1:
+            results.append({"size": len(members), "uploads": members})
+    results.sort(key=lambda cluster: cluster["size"], reverse=True)
+    
+    return {"album_id": album_id, "max_distance": max_distance, "clusters": results}
+
+@api_router.get("/albums/{album_id}/uploads/{upload_id}/similar")
+def get_similar_uploads(
+    album_id: str,
+    upload_id: str,
+    max_distance: int = Query(PHASH_DEFAULT_MAX_DISTANCE, ge=0, le=PHASH_MAX_DISTANCE_LIMIT),
+    db_session: Session = Depends(get_db)
+):
+    """Fotos do álbum parecidas com um upload, da mais parecida à menos"""
+    upload = get_album_upload(album_id, upload_id, db_session)
+    if upload.phash is None:
+        raise HTTPException(status_code=404, detail="Hash perceptual ainda não calculado para este upload")
+    
+    matches = [match for match in phash_index.search(album_id, upload.phash, max_distance) if match[0] != upload_id]
+    uploads = describe_uploads([match_id for match_id, _ in matches], db_session)
+    return {
+        "upload_id": upload_id,
+        "max_distance": max_distance,
+        "similar": [
+            {**uploads[match_id], "distance": distance}
+            for match_id, distance in matches if match_id in uploads
+        ]
+    }
 
 # Include the router in the main app
 app.include_router(api_router)
@@ -694,6 +1664,7 @@ app.add_middleware(
     allow_origins=["*"],
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["X-Next-Cursor"],
 )
 
 # Configure logging
@@ -705,4 +1676,12 @@ logger = logging.getLogger(__name__)
 
 @app.on_event("shutdown")
 async def shutdown_db_client():
-    client.close()
+    status_store.close()
+    await upload_spool.stop()
+    await upload_session_sweeper.stop()
+    await token_refresher.stop()
+    await counter_reconciler.stop()
+    await album_expiry_sweeper.stop()
+    await config_store.stop()
+    await thumbnail_pipeline.stop()
+    shutdown_executors()
@@ -0,0 +1,103 @@
+"""Cores ativas do site em cache no processo, servidas como JSON e como folha de estilo CSS"""
+import asyncio
+import hashlib
+import os
+import re
+import time
+from typing import Awaitable, Callable, NamedTuple, Optional
+
+from sqlalchemy.orm import Session
+
+from database import SiteColors
+
+# Outros processos só veem uma alteração quando o cache deles expira
+SITE_COLORS_CACHE_TTL_SECONDS = int(os.environ.get('SITE_COLORS_CACHE_TTL_SECONDS', 30))
+SITE_COLORS_CACHE_CONTROL = os.environ.get('SITE_COLORS_CACHE_CONTROL', 'public, max-age=60')
+
+# Coluna -> nome da variável CSS (--color-<nome>), o mesmo usado por use-site-colors.js
+CSS_VARIABLES = {
+    'primary': 'primary',
+    'secondary': 'secondary',
+    'accent': 'accent',
+    'background': 'background',
+    'surface': 'surface',
+    'text_primary': 'textPrimary',
+    'text_secondary': 'textSecondary',
+    'success': 'success',
+    'warning': 'warning',
+    'error': 'error',
+    'border': 'border',
+    'button_primary': 'buttonPrimary',
+    'button_secondary': 'buttonSecondary',
+    'header_bg': 'headerBg',
+    'header_text': 'headerText',
+    'input_border': 'inputBorder',
+    'link_color': 'linkColor',
+    'hover_color': 'hoverColor',
+}
+
+HEX_COLOR = re.compile(r'^#(?:[0-9a-fA-F]{3}|[0-9a-fA-F]{4}|[0-9a-fA-F]{6}|[0-9a-fA-F]{8})$')
+
+class CachedSiteColors(NamedTuple):
+    etag: str  # Sem aspas nem sufixo de representação
+    json_body: bytes
+    css_body: bytes
+    loaded_at: float
+
+def colors_version(colors: SiteColors) -> str:
+    """Versão das cores: muda sempre que a linha ativa muda (outra linha ou updated_at novo)"""
+    updated_at = colors.updated_at.isoformat() if colors.updated_at else ''
+    return hashlib.sha1(f"{colors.id}:{updated_at}".encode()).hexdigest()[:20]
+
+def render_css(colors: SiteColors) -> str:
+    """Folha de estilo com as cores como variáveis CSS em :root (valores inválidos são omitidos)"""
+    lines = [':root {']
+    for column, variable in CSS_VARIABLES.items():
+        value = getattr(colors, column)
+        if value and HEX_COLOR.match(value):
+            lines.append(f"  --color-{variable}: {value};")
+    lines.append('}')
+    return '\n'.join(lines) + '\n'
+
+def ensure_default_site_colors(db: Session):
+    """Cria as cores padrão se ainda não houver configuração ativa (roda no startup, não no GET)"""
+    if not db.query(SiteColors.id).filter(SiteColors.is_active == True).first():
+        db.add(SiteColors(is_active=True))
+        db.commit()
+
+class SiteColorsCache:
+    """Última versão das cores já serializada; invalidada pelas rotas que salvam cores"""
+
+    def __init__(self, ttl_seconds: int = SITE_COLORS_CACHE_TTL_SECONDS):
+        self.ttl_seconds = ttl_seconds
+        self._entry: Optional[CachedSiteColors] = None
+        self._generation = 0
+        self._async_lock = asyncio.Lock()
+
+    def peek(self) -> Optional[CachedSiteColors]:
+        """Entrada em cache ainda válida, sem acessar o banco"""
+        entry = self._entry
+        if entry and time.monotonic() - entry.loaded_at < self.ttl_seconds:
+            return entry
+        return None
+
+    async def get_async(self, load: Callable[[], Awaitable[Optional[CachedSiteColors]]]) -> Optional[CachedSiteColors]:
+        """Entrada em cache, carregando uma vez só mesmo com várias requisições simultâneas"""
+        entry = self.peek()
+        if entry:
+            return entry
+        async with self._async_lock:
+            entry = self.peek()
+            if entry is None:
+                generation = self._generation
+                entry = await load()
+                # Invalidado durante a leitura: a entrada pode ser anterior ao salvamento
+                if generation == self._generation:
+                    self._entry = entry
+            return entry
+
+    def invalidate(self):
+        self._generation += 1
+        self._entry = None
+
+site_colors_cache = SiteColorsCache()
@@ -0,0 +1,94 @@
+"""Status checks no MongoDB: conexão só no primeiro uso e coleção limitada por um índice TTL"""
+import asyncio
+import logging
+import os
+from datetime import datetime
+from typing import Any, AsyncIterator, Dict, Optional
+
+logger = logging.getLogger(__name__)
+
+# Opcional: sem MONGO_URL o backend sobe normalmente e só /api/status responde 503
+MONGO_URL = os.environ.get('MONGO_URL')
+MONGO_DB_NAME = os.environ.get('DB_NAME', 'upnafesta')
+STATUS_CHECK_TTL_SECONDS = int(os.environ.get('STATUS_CHECK_TTL_SECONDS', 30 * 24 * 3600))
+STATUS_LIST_DEFAULT_LIMIT = int(os.environ.get('STATUS_LIST_DEFAULT_LIMIT', 100))
+STATUS_LIST_MAX_LIMIT = int(os.environ.get('STATUS_LIST_MAX_LIMIT', 1000))
+
+STATUS_COLLECTION = 'status_checks'
+TTL_INDEX_NAME = 'timestamp_ttl'
+
+class MongoNotConfigured(RuntimeError):
+    pass
+
+class StatusStore:
+    """Cliente do Mongo criado sob demanda, com os índices garantidos uma vez por processo"""
+
+    def __init__(self, mongo_url: Optional[str] = MONGO_URL, db_name: str = MONGO_DB_NAME):
+        self.mongo_url = mongo_url
+        self.db_name = db_name
+        self._client = None
+        self._indexes_ready = False
+        self._lock = asyncio.Lock()
+
+    @property
+    def configured(self) -> bool:
+        return bool(self.mongo_url)
+
+    async def collection(self):
+        if not self.configured:
+            raise MongoNotConfigured("MongoDB não configurado")
+        if self._client is None or not self._indexes_ready:
+            async with self._lock:
+                if self._client is None:
+                    # Import tardio: o motor só é necessário para quem usa /api/status
+                    from motor.motor_asyncio import AsyncIOMotorClient
+                    self._client = AsyncIOMotorClient(self.mongo_url)
+                if not self._indexes_ready:
+                    await self._ensure_indexes(self._client[self.db_name][STATUS_COLLECTION])
+                    self._indexes_ready = True
+        return self._client[self.db_name][STATUS_COLLECTION]
+
+    async def _ensure_indexes(self, collection):
+        from pymongo import DESCENDING
+        from pymongo.errors import OperationFailure
+
+        # Ordem da listagem (mais recentes primeiro, id desempata)
+        await collection.create_index([('timestamp', DESCENDING), ('id', DESCENDING)], name='timestamp_id')
+        try:
+            await collection.create_index('timestamp', name=TTL_INDEX_NAME, expireAfterSeconds=STATUS_CHECK_TTL_SECONDS)
+        except OperationFailure:
+            # Índice já existe com outro prazo: ajusta no lugar em vez de recriar
+            await collection.database.command({
+                'collMod': STATUS_COLLECTION,
+                'index': {'name': TTL_INDEX_NAME, 'expireAfterSeconds': STATUS_CHECK_TTL_SECONDS}
+            })
+
+    async def insert(self, document: Dict[str, Any]):
+        collection = await self.collection()
+        await collection.insert_one(dict(document))
+
+    async def iter_page(
+        self,
+        limit: int,
+        after_timestamp: Optional[datetime] = None,
+        after_id: Optional[str] = None
+    ) -> AsyncIterator[Dict[str, Any]]:
+        """Documentos mais recentes primeiro, a partir do cursor; traz um a mais para saber se há próxima página"""
+        collection = await self.collection()
+        query: Dict[str, Any] = {}
+        if after_timestamp is not None:
+            query = {'$or': [
+                {'timestamp': {'$lt': after_timestamp}},
+                {'timestamp': after_timestamp, 'id': {'$lt': after_id}}
+            ]}
+        cursor = collection.find(query, {'_id': 0}).sort([('timestamp', -1), ('id', -1)]).limit(limit + 1)
+        async for document in cursor:
+            yield document
+
+    def close(self):
+        if self._client is not None:
+            self._client.close()
+            self._client = None
+            self._indexes_ready = False
+
+status_store = StatusStore()
@@ -0,0 +1,77 @@
+"""Totais de armazenamento dos uploads (por álbum ou da plataforma), com cache curto"""
+import os
+import threading
+import time
+from datetime import datetime
+from typing import Any, Dict, Optional, Tuple
+
+from sqlalchemy import case, func
+from sqlalchemy.orm import Session
+
+from database import Upload
+
+STORAGE_ROLLUP_TTL_SECONDS = int(os.environ.get('STORAGE_ROLLUP_TTL_SECONDS', 60))
+
+MIME_FAMILIES = ('image', 'video', 'audio')
+
+_rollup_cache: Dict[Optional[str], Tuple[float, Dict[str, Any]]] = {}
+_rollup_cache_lock = threading.Lock()
+
+def compute_storage_rollup(db: Session, album_id: Optional[str] = None) -> Dict[str, Any]:
+    """Bytes e quantidade por família de tipo e por dia, numa única consulta agregada"""
+    mime_family = case(
+        *((Upload.mime_type.like(f"{family}/%"), family) for family in MIME_FAMILIES),
+        else_='other'
+    ).label('mime_family')
+    day = func.date(Upload.uploaded_at).label('day')
+
+    query = db.query(
+        mime_family,
+        day,
+        func.count(Upload.id).label('count'),
+        func.coalesce(func.sum(Upload.size_bytes), 0).label('bytes')
+    ).filter(Upload.status == 'stored')
+    if album_id:
+        query = query.filter(Upload.album_id == album_id)
+    rows = query.group_by(mime_family, day).all()
+
+    # As linhas já vêm agregadas por (família, dia): o resto é soma de poucas linhas
+    by_family: Dict[str, Dict[str, int]] = {}
+    by_day: Dict[str, Dict[str, int]] = {}
+    for row in rows:
+        row_bytes = int(row.bytes or 0)
+        family = by_family.setdefault(row.mime_family, {'bytes': 0, 'count': 0})
+        family['bytes'] += row_bytes
+        family['count'] += row.count
+
+        day_key = str(row.day) if row.day else None
+        daily = by_day.setdefault(day_key, {'bytes': 0, 'count': 0})
+        daily['bytes'] += row_bytes
+        daily['count'] += row.count
+
+    return {
+        'album_id': album_id,
+        'total_bytes': sum(family['bytes'] for family in by_family.values()),
+        'count': sum(family['count'] for family in by_family.values()),
+        'by_mime_family': by_family,
+        'by_day': [
+            {'date': day_key, **totals}
+            for day_key, totals in sorted(by_day.items(), key=lambda item: item[0] or '')
+        ],
+        'generated_at': datetime.utcnow().isoformat()
+    }
+
+def get_storage_rollup(db: Session, album_id: Optional[str] = None) -> Dict[str, Any]:
+    """Totais de armazenamento, recalculados no máximo a cada STORAGE_ROLLUP_TTL_SECONDS"""
+    cached = _rollup_cache.get(album_id)
+    if cached and time.monotonic() - cached[0] < STORAGE_ROLLUP_TTL_SECONDS:
+        return cached[1]
+
+    rollup = compute_storage_rollup(db, album_id)
+    with _rollup_cache_lock:
+        _rollup_cache[album_id] = (time.monotonic(), rollup)
+        # Entradas vencidas de álbuns que ninguém consultou de novo
+        expired_before = time.monotonic() - STORAGE_ROLLUP_TTL_SECONDS
+        for key in [key for key, (cached_at, _) in _rollup_cache.items() if cached_at < expired_before]:
+            del _rollup_cache[key]
+    return rollup
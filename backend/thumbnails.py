@@ -0,0 +1,232 @@
+"""Pipeline de miniaturas das fotos dos álbuns e cache local com despejo LRU por bytes"""
+import asyncio
+import logging
+import os
+import shutil
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from pathlib import Path
+from typing import BinaryIO, List, Optional
+
+from starlette.concurrency import run_in_threadpool
+
+from database import SessionLocal, Album, Upload
+from executors import run_in_drive_pool
+from google_drive_service import GoogleDriveService
+from image_processing import image_executor, render_thumbnails, thumbnail_path
+from phash_index import phash_index
+
+logger = logging.getLogger(__name__)
+
+THUMBNAIL_CACHE_DIR = Path(os.environ.get('THUMBNAIL_CACHE_DIR', Path(__file__).parent / 'thumbnail_cache'))
+THUMBNAIL_CACHE_MAX_BYTES = int(os.environ.get('THUMBNAIL_CACHE_MAX_BYTES', 2 * 1024 ** 3))
+THUMBNAIL_SIZES = tuple(int(size) for size in os.environ.get('THUMBNAIL_SIZES', '160,480,1024').split(','))
+THUMBNAIL_WORKERS = int(os.environ.get('THUMBNAIL_WORKERS', 2))
+
+# Originais aguardando processamento ficam aqui (fora da árvore endereçada por conteúdo)
+THUMBNAIL_INBOX_DIR = THUMBNAIL_CACHE_DIR / 'inbox'
+THUMBNAIL_INBOX_MAX_AGE_SECONDS = 3600
+
+STAGE_COPY_CHUNK_SIZE = 1024 * 1024
+
+class ThumbnailCache:
+    """Índice LRU das miniaturas em disco, limitado pelo total de bytes"""
+
+    def __init__(self, cache_dir: Path = THUMBNAIL_CACHE_DIR, max_bytes: int = THUMBNAIL_CACHE_MAX_BYTES):
+        self.cache_dir = Path(cache_dir)
+        self.max_bytes = max_bytes
+        self.total_bytes = 0
+        self._entries: "OrderedDict[str, int]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def load(self):
+        """Reconstrói o índice a partir do disco, do acesso mais antigo ao mais recente"""
+        files = []
+        for path in self.cache_dir.glob('??/*.jpg'):
+            stat = path.stat()
+            files.append((stat.st_mtime, str(path), stat.st_size))
+
+        with self._lock:
+            self._entries.clear()
+            for _, path, size in sorted(files):
+                self._entries[path] = size
+            self.total_bytes = sum(self._entries.values())
+        self._evict()
+
+    def lookup(self, content_hash: str, size: int) -> Optional[Path]:
+        """Caminho da miniatura se estiver no cache, marcando-a como usada"""
+        path = thumbnail_path(self.cache_dir, content_hash, size)
+        key = str(path)
+        if not path.exists():
+            with self._lock:
+                self.total_bytes -= self._entries.pop(key, 0)
+            return None
+
+        with self._lock:
+            if key in self._entries:
+                self._entries.move_to_end(key)
+            else:
+                # Gerada por outro processo
+                self._entries[key] = path.stat().st_size
+                self.total_bytes += self._entries[key]
+        try:
+            os.utime(path)
+        except OSError:
+            pass
+        return path
+
+    def register(self, content_hash: str, generated: dict):
+        """Contabiliza miniaturas recém-geradas e despeja as menos usadas se passar do limite"""
+        with self._lock:
+            for size, file_size in generated.items():
+                key = str(thumbnail_path(self.cache_dir, content_hash, size))
+                self.total_bytes -= self._entries.pop(key, 0)
+                self._entries[key] = file_size
+                self.total_bytes += file_size
+        self._evict()
+
+    def _evict(self):
+        with self._lock:
+            while self.total_bytes > self.max_bytes and self._entries:
+                path, size = self._entries.popitem(last=False)
+                self.total_bytes -= size
+                try:
+                    os.remove(path)
+                except OSError:
+                    pass
+
+class ThumbnailPipeline:
+    """Fila de originais a processar; o trabalho de imagem roda no image_executor"""
+
+    def __init__(self, cache: ThumbnailCache, workers: int = THUMBNAIL_WORKERS):
+        self.cache = cache
+        self.workers = workers
+        self.queue: Optional[asyncio.Queue] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._tasks: List[asyncio.Task] = []
+
+    def stage_path(self) -> Path:
+        THUMBNAIL_INBOX_DIR.mkdir(parents=True, exist_ok=True)
+        return THUMBNAIL_INBOX_DIR / str(uuid.uuid4())
+
+    def stage_stream(self, stream: BinaryIO) -> Path:
+        """Copia um arquivo aberto para a caixa de entrada (bloqueante)"""
+        path = self.stage_path()
+        stream.seek(0)
+        with open(path, 'wb') as out:
+            shutil.copyfileobj(stream, out, STAGE_COPY_CHUNK_SIZE)
+        stream.seek(0)
+        return path
+
+    def submit(self, upload_id: str, source_path: Path):
+        """Agenda as miniaturas de um upload; pode ser chamado de qualquer thread
+
+        O pipeline passa a ser dono de `source_path` e o remove ao terminar.
+        """
+        if self._loop is None:
+            os.remove(source_path)
+            return
+        self._loop.call_soon_threadsafe(self.queue.put_nowait, (upload_id, str(source_path)))
+
+    async def render(self, upload_id: str, source_path: str) -> Optional[str]:
+        """Gera as miniaturas fora do event loop e grava no upload a chave do cache e o pHash"""
+        try:
+            loop = asyncio.get_running_loop()
+            content_hash, generated, phash = await loop.run_in_executor(
+                image_executor, render_thumbnails, source_path, str(self.cache.cache_dir), THUMBNAIL_SIZES
+            )
+        finally:
+            try:
+                os.remove(source_path)
+            except OSError:
+                pass
+
+        self.cache.register(content_hash, generated)
+        album_id = await run_in_threadpool(save_image_hashes, upload_id, content_hash, phash)
+        if album_id and phash is not None:
+            phash_index.add(album_id, upload_id, phash)
+        return content_hash
+
+    async def render_from_drive(self, upload: Upload) -> Optional[str]:
+        """Baixa o original do Drive e gera as miniaturas (uploads sem cópia local)"""
+        source_path = self.stage_path()
+        await run_in_drive_pool(download_original, upload.album_id, upload.google_file_id, source_path)
+        return await self.render(upload.id, str(source_path))
+
+    async def start(self):
+        self.cache.cache_dir.mkdir(parents=True, exist_ok=True)
+        await run_in_threadpool(self.cache.load)
+        self._loop = asyncio.get_running_loop()
+        self.queue = asyncio.Queue()
+        self._tasks = [asyncio.create_task(self._worker()) for _ in range(self.workers)]
+
+        # Originais esquecidos por uma execução anterior (outros processos podem estar usando os recentes)
+        stale_before = time.time() - THUMBNAIL_INBOX_MAX_AGE_SECONDS
+        for leftover in THUMBNAIL_INBOX_DIR.glob('*'):
+            if leftover.stat().st_mtime < stale_before:
+                leftover.unlink(missing_ok=True)
+
+    async def stop(self):
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+        self._loop = None
+
+    async def _worker(self):
+        while True:
+            upload_id, source_path = await self.queue.get()
+            try:
+                await self.render(upload_id, source_path)
+            except Exception:
+                logger.exception(f"Erro ao gerar miniaturas do upload {upload_id}")
+            finally:
+                self.queue.task_done()
+
+def thumbnail_key_for(upload: Upload) -> Optional[str]:
+    """Chave das miniaturas no cache; uploads antigos sem recompressão usam o próprio hash do conteúdo"""
+    if upload.thumbnail_key:
+        return upload.thumbnail_key
+    if upload.original_size_bytes is None or upload.original_size_bytes == upload.size_bytes:
+        return upload.content_hash
+    return None
+
+def save_image_hashes(upload_id: str, rendered_hash: str, phash: Optional[int]) -> Optional[str]:
+    """Grava a chave das miniaturas e o pHash no upload e retorna o álbum dele
+
+    O hash do arquivo renderizado só vira content_hash (chave de deduplicação) em uploads
+    antigos sem hash e sem recompressão: nos recomprimidos ele não é o que o convidado enviou.
+    """
+    db = SessionLocal()
+    try:
+        db.query(Upload).filter(Upload.id == upload_id).update(
+            {'thumbnail_key': rendered_hash, 'phash': phash}, synchronize_session=False
+        )
+        db.query(Upload).filter(
+            Upload.id == upload_id,
+            Upload.content_hash == None,
+            (Upload.original_size_bytes == None) | (Upload.original_size_bytes == Upload.size_bytes)
+        ).update({'content_hash': rendered_hash}, synchronize_session=False)
+        db.commit()
+        row = db.query(Upload.album_id).filter(Upload.id == upload_id).first()
+        return row.album_id if row else None
+    finally:
+        db.close()
+
+def download_original(album_id: str, google_file_id: str, dest_path: Path):
+    """Baixa o arquivo original do Drive para o disco (bloqueante)"""
+    db = SessionLocal()
+    try:
+        album = db.query(Album).filter(Album.id == album_id).first()
+        with open(dest_path, 'wb') as out:
+            GoogleDriveService(db).download_file(album.client_id, google_file_id, out)
+    except Exception:
+        Path(dest_path).unlink(missing_ok=True)
+        raise
+    finally:
+        db.close()
+
+thumbnail_cache = ThumbnailCache()
+thumbnail_pipeline = ThumbnailPipeline(thumbnail_cache)
@@ -0,0 +1,108 @@
+"""Renovação antecipada dos tokens OAuth, fora do caminho dos uploads dos convidados"""
+import asyncio
+import logging
+import os
+from datetime import datetime, date, timedelta
+from typing import Any, Dict, List, Optional
+
+from sqlalchemy import exists
+
+from database import SessionLocal, Album, GoogleToken
+from executors import run_in_drive_pool
+from google_drive_service import GoogleDriveService
+
+logger = logging.getLogger(__name__)
+
+TOKEN_REFRESHER_ENABLED = os.environ.get('TOKEN_REFRESHER_ENABLED', 'true').lower() == 'true'
+TOKEN_REFRESH_INTERVAL_SECONDS = int(os.environ.get('TOKEN_REFRESH_INTERVAL_SECONDS', 60))
+
+# Tokens que vencem dentro desta janela são renovados antes da hora
+TOKEN_REFRESH_LEAD_MINUTES = int(os.environ.get('TOKEN_REFRESH_LEAD_MINUTES', 10))
+TOKEN_REFRESH_BATCH_SIZE = int(os.environ.get('TOKEN_REFRESH_BATCH_SIZE', 50))
+
+# Restringir aos clientes com evento hoje (senão: qualquer cliente com álbum ativo)
+TOKEN_REFRESH_EVENTS_TODAY_ONLY = os.environ.get('TOKEN_REFRESH_EVENTS_TODAY_ONLY', 'false').lower() == 'true'
+
+class TokenRefresher:
+    """Varre google_tokens periodicamente e renova em lote os que estão para vencer"""
+
+    def __init__(self):
+        self._task: Optional[asyncio.Task] = None
+        self.metrics: Dict[str, Any] = {
+            'runs': 0,
+            'refreshed': 0,
+            'failed': 0,
+            'last_run_at': None,
+            'last_run_due': 0,
+            'last_run_refreshed': 0,
+            'last_run_failed': 0,
+            'last_error': None
+        }
+
+    def due_client_ids(self, db, refresh_before: datetime) -> List[str]:
+        """Clientes com token ativo vencendo na janela e álbum ativo, mais urgentes primeiro"""
+        album_filter = (Album.client_id == GoogleToken.client_id) & (Album.status == 'active')
+        if TOKEN_REFRESH_EVENTS_TODAY_ONLY:
+            album_filter = album_filter & (Album.event_date == date.today())
+
+        rows = db.query(GoogleToken.client_id).filter(
+            GoogleToken.is_active == True,
+            GoogleToken.refresh_token != None,
+            GoogleToken.expires_at != None,
+            GoogleToken.expires_at <= refresh_before,
+            exists().where(album_filter)
+        ).order_by(GoogleToken.expires_at).limit(TOKEN_REFRESH_BATCH_SIZE).all()
+        return [row.client_id for row in rows]
+
+    def run_once(self) -> Dict[str, int]:
+        """Executa uma varredura (bloqueante, roda no pool do Drive)"""
+        refresh_before = datetime.utcnow() + timedelta(minutes=TOKEN_REFRESH_LEAD_MINUTES)
+        refreshed = failed = 0
+
+        db = SessionLocal()
+        try:
+            client_ids = self.due_client_ids(db, refresh_before)
+            drive_service = GoogleDriveService(db)
+            for client_id in client_ids:
+                try:
+                    if drive_service.refresh_client_credentials(client_id, refresh_before):
+                        refreshed += 1
+                except Exception as error:
+                    db.rollback()
+                    failed += 1
+                    self.metrics['last_error'] = f"{client_id}: {error}"
+                    logger.warning(f"Falha ao renovar token do cliente {client_id}: {error}")
+        finally:
+            db.close()
+
+        self.metrics['runs'] += 1
+        self.metrics['refreshed'] += refreshed
+        self.metrics['failed'] += failed
+        self.metrics['last_run_at'] = datetime.utcnow().isoformat()
+        self.metrics['last_run_due'] = len(client_ids)
+        self.metrics['last_run_refreshed'] = refreshed
+        self.metrics['last_run_failed'] = failed
+
+        return {'due': len(client_ids), 'refreshed': refreshed, 'failed': failed}
+
+    async def start(self):
+        if TOKEN_REFRESHER_ENABLED and self._task is None:
+            self._task = asyncio.create_task(self._loop())
+
+    async def stop(self):
+        if self._task:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+
+    async def _loop(self):
+        while True:
+            try:
+                result = await run_in_drive_pool(self.run_once)
+                if result['due']:
+                    logger.info(f"Refresher de tokens: {result}")
+            except Exception:
+                logger.exception("Erro na varredura de tokens do Google")
+            await asyncio.sleep(TOKEN_REFRESH_INTERVAL_SECONDS)
+
+token_refresher = TokenRefresher()
@@ -0,0 +1,148 @@
+"""Envio de um arquivo recebido ao Drive, com recompressão opcional configurada por álbum"""
+import hashlib
+import logging
+import os
+import shutil
+import tempfile
+import threading
+from contextlib import contextmanager
+from typing import BinaryIO, Callable, Dict, List, Optional, Sequence, Tuple
+
+from google.oauth2.credentials import Credentials
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+
+from database import Album, Upload
+from dashboard_counters import bump_stored_uploads
+from google_drive_service import GoogleDriveService
+from image_processing import image_executor, recompress_image
+
+logger = logging.getLogger(__name__)
+
+RECOMPRESS_MIME_TYPES = {'image/jpeg', 'image/png', 'image/webp'}
+
+RECOMPRESS_WORK_DIR = os.environ.get('RECOMPRESS_WORK_DIR') or None  # None: diretório temporário do sistema
+
+COPY_CHUNK_SIZE = 1024 * 1024
+
+def get_stream_size(stream) -> int:
+    """Tamanho em bytes de um arquivo aberto, sem ler o conteúdo"""
+    stream.seek(0, os.SEEK_END)
+    size = stream.tell()
+    stream.seek(0)
+    return size
+
+def hash_stream(stream: BinaryIO) -> str:
+    """SHA-256 de um arquivo aberto, lido em blocos (volta ao início no fim)"""
+    digest = hashlib.sha256()
+    stream.seek(0)
+    for block in iter(lambda: stream.read(COPY_CHUNK_SIZE), b''):
+        digest.update(block)
+    stream.seek(0)
+    return digest.hexdigest()
+
+def find_duplicate_upload(db: Session, album_id: str, content_hash: str,
+                          statuses: Sequence[str] = ('stored',)) -> Optional[Upload]:
+    """Upload do álbum com o mesmo conteúdo (usa o índice album_id + content_hash)"""
+    return db.query(Upload).filter(
+        Upload.album_id == album_id,
+        Upload.content_hash == content_hash,
+        Upload.status.in_(statuses)
+    ).order_by(Upload.uploaded_at).first()
+
+# (álbum, hash) -> [lock, quantos o usam]; a entrada some quando ninguém mais espera
+_dedup_locks: Dict[Tuple[str, str], List] = {}
+_dedup_locks_guard = threading.Lock()
+
+@contextmanager
+def dedup_single_flight(album_id: str, content_hash: str):
+    """Serializa, neste processo, verificação + envio + gravação do mesmo conteúdo no mesmo álbum"""
+    key = (album_id, content_hash)
+    with _dedup_locks_guard:
+        entry = _dedup_locks.setdefault(key, [threading.Lock(), 0])
+        entry[1] += 1
+    try:
+        with entry[0]:
+            yield
+    finally:
+        with _dedup_locks_guard:
+            entry[1] -= 1
+            if not entry[1]:
+                del _dedup_locks[key]
+
+def save_new_upload(db: Session, record: Upload) -> Tuple[Upload, bool]:
+    """Grava um upload novo e retorna (upload, duplicado)
+
+    Entre workers o single-flight não vale: se outro gravou o mesmo conteúdo antes, o índice
+    único (album_id, dedup_hash) recusa a linha e o upload dele é retornado como duplicado.
+    """
+    record.dedup_hash = record.content_hash
+    db.add(record)
+    if record.status == 'stored':
+        bump_stored_uploads(db, 1, record.size_bytes)
+    try:
+        db.commit()
+    except IntegrityError:
+        db.rollback()
+        existing = db.query(Upload).filter(
+            Upload.album_id == record.album_id,
+            Upload.dedup_hash == record.content_hash
+        ).first()
+        if existing is None:
+            raise
+        return existing, True
+    return record, False
+
+def should_recompress(album: Album, mime_type: Optional[str]) -> bool:
+    return bool(album.recompress_images) and (mime_type or '').lower() in RECOMPRESS_MIME_TYPES
+
+def push_to_drive(drive_service: GoogleDriveService, album: Album, folder_id: str, stream: BinaryIO,
+                  filename: str, mime_type: Optional[str], credentials: Optional[Credentials] = None,
+                  source_path: Optional[str] = None,
+                  on_chunk: Optional[Callable[[], None]] = None) -> Tuple[Optional[str], int, int]:
+    """Envia o arquivo ao Drive (bloqueante)
+
+    Se o álbum pedir, fotos são reduzidas e recomprimidas no image_executor antes do
+    envio. Retorna (google_file_id, bytes originais, bytes gravados no Drive).
+    """
+    original_size = get_stream_size(stream)
+
+    if not should_recompress(album, mime_type):
+        google_file_id = drive_service.upload_file(
+            album.client_id, folder_id, stream, filename, mime_type, credentials, on_chunk
+        )
+        return google_file_id, original_size, original_size
+
+    with tempfile.TemporaryDirectory(dir=RECOMPRESS_WORK_DIR) as work_dir:
+        # Os processos do pool precisam de um caminho; arquivos temporários do upload não têm
+        if not source_path:
+            source_path = os.path.join(work_dir, 'original')
+            with open(source_path, 'wb') as out:
+                shutil.copyfileobj(stream, out, COPY_CHUNK_SIZE)
+            stream.seek(0)
+
+        dest_path = os.path.join(work_dir, 'recompressed')
+        try:
+            stored_size = image_executor.submit(
+                recompress_image,
+                source_path,
+                dest_path,
+                album.recompress_max_edge or 2560,
+                album.recompress_quality or 85
+            ).result()
+        except Exception as error:
+            # Imagem que o Pillow não entende: envia o original
+            logger.warning(f"Recompressão falhou para {filename}, enviando o original: {error}")
+            stored_size = None
+
+        if stored_size is None:
+            google_file_id = drive_service.upload_file(
+                album.client_id, folder_id, stream, filename, mime_type, credentials, on_chunk
+            )
+            return google_file_id, original_size, original_size
+
+        with open(dest_path, 'rb') as recompressed:
+            google_file_id = drive_service.upload_file(
+                album.client_id, folder_id, recompressed, filename, mime_type, credentials, on_chunk
+            )
+        return google_file_id, original_size, stored_size
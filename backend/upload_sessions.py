@@ -0,0 +1,260 @@
+"""Uploads em partes retomáveis: o convidado envia faixas de bytes e finaliza no fim"""
+import asyncio
+import logging
+import os
+import re
+import time
+import uuid
+from datetime import datetime, timedelta
+from pathlib import Path
+from typing import AsyncIterator, Dict, Optional, Tuple
+
+from fastapi import HTTPException
+from sqlalchemy.orm import Session
+from starlette.concurrency import run_in_threadpool
+
+from database import SessionLocal, Album, Upload, UploadSession
+from image_processing import hash_file
+from upload_processing import find_duplicate_upload, dedup_single_flight, save_new_upload
+from upload_spool import upload_spool
+
+logger = logging.getLogger(__name__)
+
+# Tamanho de bloco sugerido ao cliente ao abrir a sessão
+UPLOAD_SESSION_CHUNK_SIZE = int(os.environ.get('UPLOAD_SESSION_CHUNK_SIZE', 8 * 1024 * 1024))
+# Maior arquivo aceito numa sessão
+UPLOAD_SESSION_MAX_SIZE = int(os.environ.get('UPLOAD_SESSION_MAX_SIZE', 4 * 1024 * 1024 * 1024))
+# Sessões abertas sem bloco novo por esse tempo são descartadas (linha e arquivo parcial)
+UPLOAD_SESSION_TTL_SECONDS = int(os.environ.get('UPLOAD_SESSION_TTL_SECONDS', 24 * 3600))
+UPLOAD_SESSION_SWEEP_INTERVAL_SECONDS = int(os.environ.get('UPLOAD_SESSION_SWEEP_INTERVAL_SECONDS', 3600))
+
+CONTENT_RANGE_PATTERN = re.compile(r'^bytes (\d+)-(\d+)/(\d+)$')
+
+def session_file_path(session_id: str) -> Path:
+    """Arquivo parcial da sessão, dentro do diretório de spool"""
+    return upload_spool.spool_dir / 'sessions' / session_id
+
+def parse_content_range(header: str) -> Tuple[int, int, int]:
+    """Interpreta 'bytes início-fim/total' (fim inclusivo)"""
+    match = CONTENT_RANGE_PATTERN.match(header.strip())
+    if not match:
+        raise ValueError("Content-Range inválido, use 'bytes início-fim/total'")
+    start, end, total = (int(value) for value in match.groups())
+    if start > end or end >= total:
+        raise ValueError("Faixa de bytes inválida no Content-Range")
+    return start, end, total
+
+def create_upload_session(album: Album, filename: str, mime_type: str, total_size: int,
+                          guest_name: str, comment: str, db_session: Session) -> UploadSession:
+    """Abre uma sessão e reserva o arquivo parcial em disco"""
+    upload_session = UploadSession(
+        id=str(uuid.uuid4()),
+        album_id=album.id,
+        filename=filename,
+        mime_type=mime_type,
+        total_size=total_size,
+        committed_offset=0,
+        uploaded_by=guest_name,
+        upload_comment=comment,
+        status='open'
+    )
+
+    path = session_file_path(upload_session.id)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.touch()
+
+    db_session.add(upload_session)
+    db_session.commit()
+    db_session.refresh(upload_session)
+
+    return upload_session
+
+def get_upload_session(album_id: str, session_id: str, db_session: Session) -> UploadSession:
+    upload_session = db_session.query(UploadSession).filter(
+        UploadSession.id == session_id,
+        UploadSession.album_id == album_id
+    ).first()
+    if not upload_session:
+        raise HTTPException(status_code=404, detail="Sessão de upload não encontrada")
+    return upload_session
+
+def _sync_and_close(out):
+    out.flush()
+    os.fsync(out.fileno())
+    out.close()
+
+async def write_session_chunk(session_id: str, start: int, length: int,
+                              chunks: AsyncIterator[bytes]) -> int:
+    """Grava o corpo da requisição no arquivo parcial a partir de `start`, bloco a bloco"""
+    out = await run_in_threadpool(open, session_file_path(session_id), 'r+b')
+    written = 0
+    try:
+        await run_in_threadpool(out.seek, start)
+        async for chunk in chunks:
+            if written + len(chunk) > length:
+                raise ValueError("Corpo maior que a faixa informada no Content-Range")
+            await run_in_threadpool(out.write, chunk)
+            written += len(chunk)
+    finally:
+        await run_in_threadpool(_sync_and_close, out)
+    return written
+
+def commit_session_offset(session_id: str, start: int, new_offset: int, db_session: Session) -> int:
+    """Avança o offset confirmado se o bloco gravado for contíguo a ele"""
+    db_session.query(UploadSession).filter(
+        UploadSession.id == session_id,
+        UploadSession.committed_offset >= start,
+        UploadSession.committed_offset < new_offset
+    ).update({'committed_offset': new_offset, 'updated_at': datetime.utcnow()}, synchronize_session=False)
+    db_session.commit()
+
+    return db_session.query(UploadSession.committed_offset).filter(
+        UploadSession.id == session_id
+    ).scalar()
+
+def reserve_finalization(session_id: str, upload_id: str, db_session: Session) -> bool:
+    """Marca a sessão como finalizada (sem commit); uma chamada concorrente fica bloqueada na linha e depois não encontra 'open'"""
+    return bool(db_session.query(UploadSession).filter(
+        UploadSession.id == session_id,
+        UploadSession.status == 'open'
+    ).update({'status': 'finalized', 'upload_id': upload_id}, synchronize_session=False))
+
+def finalize_upload_session(upload_session: UploadSession, db_session: Session) -> Upload:
+    """Move o arquivo completo para o spool e cria o upload pendente (idempotente)"""
+    if upload_session.status == 'finalized':
+        return db_session.query(Upload).filter(Upload.id == upload_session.upload_id).first()
+
+    if upload_session.committed_offset != upload_session.total_size:
+        raise HTTPException(
+            status_code=409,
+            detail=f"Upload incompleto: {upload_session.committed_offset} de {upload_session.total_size} bytes"
+        )
+
+    partial_path = session_file_path(upload_session.id)
+    content_hash = hash_file(str(partial_path))
+    with dedup_single_flight(upload_session.album_id, content_hash):
+        duplicate = find_duplicate_upload(db_session, upload_session.album_id, content_hash, ('stored', 'pending'))
+        upload_id = duplicate.id if duplicate else str(uuid.uuid4())
+
+        if not reserve_finalization(upload_session.id, upload_id, db_session):
+            db_session.rollback()
+            db_session.refresh(upload_session)
+            return db_session.query(Upload).filter(Upload.id == upload_session.upload_id).first()
+
+        if duplicate:
+            # Mesmo conteúdo já enviado a este álbum: nada vai ao Drive
+            db_session.commit()
+            partial_path.unlink(missing_ok=True)
+            return duplicate
+
+        spool_path = upload_spool.spool_dir / upload_id
+        try:
+            os.replace(partial_path, spool_path)
+
+            upload_record, duplicate = save_new_upload(db_session, Upload(
+                id=upload_id,
+                album_id=upload_session.album_id,
+                filename=upload_session.filename,
+                uploaded_by=upload_session.uploaded_by,
+                upload_comment=upload_session.upload_comment,
+                file_size=f"{upload_session.total_size / (1024*1024):.2f} MB",
+                original_size_bytes=upload_session.total_size,
+                size_bytes=upload_session.total_size,
+                mime_type=upload_session.mime_type,
+                status='pending',
+                spool_path=str(spool_path),
+                content_hash=content_hash,
+                attempts=0
+            ))
+        except Exception:
+            db_session.rollback()
+            if spool_path.exists():
+                os.replace(spool_path, partial_path)
+            raise
+
+        if duplicate:
+            # Outro worker gravou o mesmo conteúdo antes: o rollback desfez a reserva, refeita apontando para ele
+            spool_path.unlink(missing_ok=True)
+            if not reserve_finalization(upload_session.id, upload_record.id, db_session):
+                db_session.rollback()
+                db_session.refresh(upload_session)
+                return db_session.query(Upload).filter(Upload.id == upload_session.upload_id).first()
+            db_session.commit()
+            return upload_record
+
+    db_session.refresh(upload_record)
+    return upload_record
+
+def expire_stale_upload_sessions(db: Session, ttl_seconds: int = UPLOAD_SESSION_TTL_SECONDS) -> Dict[str, int]:
+    """Remove sessões abertas abandonadas e arquivos parciais sem sessão aberta"""
+    cutoff = datetime.utcnow() - timedelta(seconds=ttl_seconds)
+    stale_ids = [row.id for row in db.query(UploadSession.id).filter(
+        UploadSession.status == 'open',
+        UploadSession.updated_at < cutoff
+    ).all()]
+
+    expired = 0
+    for session_id in stale_ids:
+        # Condicional: um bloco que chegou depois da consulta mantém a sessão viva
+        deleted = db.query(UploadSession).filter(
+            UploadSession.id == session_id,
+            UploadSession.status == 'open',
+            UploadSession.updated_at < cutoff
+        ).delete(synchronize_session=False)
+        db.commit()
+        if deleted:
+            session_file_path(session_id).unlink(missing_ok=True)
+            expired += 1
+
+    # Arquivos parciais órfãos (ex.: processo caiu entre criar o arquivo e gravar a linha)
+    orphans = 0
+    sessions_dir = upload_spool.spool_dir / 'sessions'
+    if sessions_dir.exists():
+        stale_before = time.time() - ttl_seconds
+        for path in sessions_dir.iterdir():
+            if path.stat().st_mtime >= stale_before:
+                continue
+            is_open = db.query(UploadSession.id).filter(
+                UploadSession.id == path.name,
+                UploadSession.status == 'open'
+            ).first()
+            if not is_open:
+                path.unlink(missing_ok=True)
+                orphans += 1
+
+    return {'expired': expired, 'orphans': orphans}
+
+class UploadSessionSweeper:
+    """Descarta sessões abandonadas ao iniciar e depois a cada UPLOAD_SESSION_SWEEP_INTERVAL_SECONDS"""
+
+    def __init__(self):
+        self._task: Optional[asyncio.Task] = None
+
+    def run_once(self) -> Dict[str, int]:
+        db = SessionLocal()
+        try:
+            return expire_stale_upload_sessions(db)
+        finally:
+            db.close()
+
+    async def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self._loop())
+
+    async def stop(self):
+        if self._task:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+
+    async def _loop(self):
+        while True:
+            try:
+                result = await run_in_threadpool(self.run_once)
+                if result['expired'] or result['orphans']:
+                    logger.info(f"Sessões de upload abandonadas removidas: {result}")
+            except Exception:
+                logger.exception("Erro ao remover sessões de upload abandonadas")
+            await asyncio.sleep(UPLOAD_SESSION_SWEEP_INTERVAL_SECONDS)
+
+upload_session_sweeper = UploadSessionSweeper()
@@ -0,0 +1,298 @@
+"""Spool local de uploads: grava o arquivo em disco e envia ao Drive em segundo plano"""
+import asyncio
+import hashlib
+import logging
+import os
+import time
+from datetime import datetime, timedelta
+from pathlib import Path
+from typing import BinaryIO, List, Optional, Set, Tuple
+
+from starlette.concurrency import run_in_threadpool
+
+from database import SessionLocal, Upload
+from dashboard_counters import bump_stored_uploads
+from executors import run_in_drive_pool
+from google_drive_service import GoogleDriveService
+from upload_processing import push_to_drive
+from image_processing import is_image
+from thumbnails import thumbnail_pipeline
+
+logger = logging.getLogger(__name__)
+
+SPOOL_DIR = Path(os.environ.get('UPLOAD_SPOOL_DIR', Path(__file__).parent / 'spool'))
+SPOOL_WORKERS = int(os.environ.get('UPLOAD_SPOOL_WORKERS', 4))
+SPOOL_MAX_ATTEMPTS = int(os.environ.get('UPLOAD_SPOOL_MAX_ATTEMPTS', 5))
+SPOOL_RETRY_BASE_SECONDS = float(os.environ.get('UPLOAD_SPOOL_RETRY_BASE_SECONDS', 5))
+
+# Tempo que um worker "segura" um upload; passado esse prazo outro processo pode assumir
+SPOOL_LEASE_SECONDS = int(os.environ.get('UPLOAD_SPOOL_LEASE_SECONDS', 1800))
+
+# Intervalo da varredura que retoma pendentes sem dono (reserva vencida de um processo que morreu)
+SPOOL_SWEEP_INTERVAL_SECONDS = int(os.environ.get('UPLOAD_SPOOL_SWEEP_INTERVAL_SECONDS', 300))
+
+SPOOL_COPY_CHUNK_SIZE = 1024 * 1024
+
+# Renovação da reserva durante o envio (arquivos grandes podem levar mais que o prazo inteiro)
+SPOOL_LEASE_RENEW_SECONDS = max(1, SPOOL_LEASE_SECONDS // 3)
+
+class LeaseLost(RuntimeError):
+    """A reserva venceu e outro worker assumiu o upload"""
+
+def lease_token() -> datetime:
+    # Sem microssegundos: DATETIME do MariaDB os descarta e a comparação do token falharia
+    return datetime.utcnow().replace(microsecond=0)
+
+def claim_upload(db, upload_id: str) -> Optional[Tuple[Upload, datetime]]:
+    """Reserva um upload pendente para este worker (evita envio duplicado entre processos)
+
+    Retorna o upload e o token da reserva (o claimed_at gravado), ou None se outro worker o tem.
+    """
+    token = lease_token()
+    lease_expired = token - timedelta(seconds=SPOOL_LEASE_SECONDS)
+
+    claimed = db.query(Upload).filter(
+        Upload.id == upload_id,
+        Upload.status == 'pending',
+        (Upload.claimed_at == None) | (Upload.claimed_at < lease_expired)
+    ).update({'claimed_at': token}, synchronize_session=False)
+    db.commit()
+
+    if not claimed:
+        return None
+    return db.query(Upload).filter(Upload.id == upload_id).first(), token
+
+def renew_claim(db, upload_id: str, token: datetime) -> datetime:
+    """Estende a reserva se ela ainda for deste worker; LeaseLost caso contrário"""
+    new_token = lease_token()
+    renewed = db.query(Upload).filter(
+        Upload.id == upload_id,
+        Upload.claimed_at == token
+    ).update({'claimed_at': new_token}, synchronize_session=False)
+    db.commit()
+    if not renewed:
+        raise LeaseLost(f"Reserva do upload {upload_id} perdida")
+    return new_token
+
+def update_if_claimed(db, upload_id: str, token: datetime, values: dict) -> bool:
+    """Grava no upload só se a reserva ainda for deste worker (compare-and-set no token)"""
+    return bool(db.query(Upload).filter(
+        Upload.id == upload_id,
+        Upload.claimed_at == token
+    ).update(values, synchronize_session=False))
+
+def push_spooled_upload(upload_id: str) -> Optional[float]:
+    """Envia um upload do spool ao Drive
+
+    Retorna o atraso em segundos para uma nova tentativa, ou None quando não há
+    mais nada a fazer (enviado, falha definitiva ou já reservado por outro worker).
+    """
+    db = SessionLocal()
+    try:
+        claim = claim_upload(db, upload_id)
+        if not claim:
+            return None
+        upload, token = claim
+        album = upload.album
+        client_id, spool_path, filename, mime_type = album.client_id, upload.spool_path, upload.filename, upload.mime_type
+        attempts = upload.attempts or 0
+
+        lease = {'token': token, 'renewed_at': time.monotonic()}
+
+        def keep_lease():
+            if time.monotonic() - lease['renewed_at'] >= SPOOL_LEASE_RENEW_SECONDS:
+                lease['token'] = renew_claim(db, upload_id, lease['token'])
+                lease['renewed_at'] = time.monotonic()
+
+        drive_service = GoogleDriveService(db)
+        try:
+            folder_id = drive_service.resolve_album_folder(album.id)
+            with open(spool_path, 'rb') as stream:
+                google_file_id, _, stored_size = push_to_drive(
+                    drive_service,
+                    album,
+                    folder_id,
+                    stream,
+                    filename,
+                    mime_type,
+                    source_path=spool_path,
+                    on_chunk=keep_lease
+                )
+            if not google_file_id:
+                raise ValueError("Falha no upload para Google Drive")
+        except LeaseLost as error:
+            db.rollback()
+            logger.warning(f"{error}: envio interrompido, outro worker continua")
+            return None
+        except Exception as error:
+            db.rollback()
+            attempts += 1
+            values = {'attempts': attempts, 'last_error': str(error)[:2000], 'claimed_at': None}
+
+            # Arquivo sumiu do spool ou tentativas esgotadas: falha definitiva
+            definitive = isinstance(error, FileNotFoundError) or attempts >= SPOOL_MAX_ATTEMPTS
+            if definitive:
+                # Libera o conteúdo: o convidado pode reenviar o mesmo arquivo
+                values.update(status='failed', dedup_hash=None)
+            owned = update_if_claimed(db, upload_id, lease['token'], values)
+            db.commit()
+            if not owned:
+                logger.warning(f"Upload {upload_id} falhou depois de perder a reserva: {error}")
+                return None
+            if definitive:
+                logger.error(f"Upload {upload_id} falhou definitivamente: {error}")
+                return None
+
+            delay = SPOOL_RETRY_BASE_SECONDS * (2 ** (attempts - 1))
+            logger.warning(f"Upload {upload_id} falhou (tentativa {attempts}), nova tentativa em {delay:.0f}s: {error}")
+            return delay
+
+        stored = update_if_claimed(db, upload_id, lease['token'], {
+            'google_file_id': google_file_id,
+            'size_bytes': stored_size,
+            'file_size': f"{stored_size / (1024*1024):.2f} MB",
+            'status': 'stored',
+            'spool_path': None,
+            'last_error': None,
+            'claimed_at': None
+        })
+        if not stored:
+            # Outro worker assumiu no meio do envio: a cópia dele é a que vale
+            db.rollback()
+            drive_service.delete_file(client_id, google_file_id)
+            logger.warning(f"Upload {upload_id} enviado depois de perder a reserva; cópia duplicada removida do Drive")
+            return None
+        bump_stored_uploads(db, 1, stored_size)
+        db.commit()
+
+        try:
+            if is_image(mime_type):
+                # A cópia local vira o original das miniaturas, sem copiar de novo
+                staged_path = thumbnail_pipeline.stage_path()
+                os.replace(spool_path, staged_path)
+                thumbnail_pipeline.submit(upload_id, staged_path)
+            else:
+                os.remove(spool_path)
+        except OSError as error:
+            logger.warning(f"Não foi possível remover {spool_path} do spool: {error}")
+        return None
+    finally:
+        db.close()
+
+class UploadSpool:
+    """Diretório de spool e pool de workers que enviam os arquivos ao Drive"""
+
+    def __init__(self, spool_dir: Path = SPOOL_DIR, workers: int = SPOOL_WORKERS):
+        self.spool_dir = Path(spool_dir)
+        self.workers = workers
+        self.queue: Optional[asyncio.Queue] = None
+        self._tasks: List[asyncio.Task] = []
+        # Na fila ou aguardando nova tentativa neste processo: a varredura não enfileira de novo
+        self._scheduled: Set[str] = set()
+
+    def write(self, upload_id: str, stream: BinaryIO) -> Tuple[str, int, str]:
+        """Grava o arquivo no spool de forma atômica e durável (bloqueante)
+
+        O SHA-256 é calculado durante a cópia; retorna (caminho, bytes, hash).
+        """
+        self.spool_dir.mkdir(parents=True, exist_ok=True)
+        partial_path = self.spool_dir / f"{upload_id}.part"
+        final_path = self.spool_dir / upload_id
+
+        digest = hashlib.sha256()
+        stream.seek(0)
+        with open(partial_path, 'wb') as out:
+            for block in iter(lambda: stream.read(SPOOL_COPY_CHUNK_SIZE), b''):
+                digest.update(block)
+                out.write(block)
+            out.flush()
+            os.fsync(out.fileno())
+            size = out.tell()
+
+        os.replace(partial_path, final_path)
+        return str(final_path), size, digest.hexdigest()
+
+    def discard(self, spool_path: str):
+        try:
+            os.remove(spool_path)
+        except OSError as error:
+            logger.warning(f"Não foi possível remover {spool_path} do spool: {error}")
+
+    def enqueue(self, upload_id: str):
+        """Coloca um upload na fila de envio ao Drive"""
+        self._scheduled.add(upload_id)
+        self.queue.put_nowait(upload_id)
+
+    def _pending_upload_ids(self, claimable_only: bool = False) -> List[str]:
+        """Uploads pendentes; com claimable_only, só os sem reserva ou com a reserva vencida"""
+        db = SessionLocal()
+        try:
+            query = db.query(Upload.id).filter(Upload.status == 'pending')
+            if claimable_only:
+                lease_expired = datetime.utcnow() - timedelta(seconds=SPOOL_LEASE_SECONDS)
+                query = query.filter((Upload.claimed_at == None) | (Upload.claimed_at < lease_expired))
+            return [row.id for row in query.all()]
+        finally:
+            db.close()
+
+    async def sweep(self) -> int:
+        """Enfileira pendentes que ninguém está enviando (ex.: processo morto no meio do envio)"""
+        pending = await run_in_threadpool(self._pending_upload_ids, True)
+        resumed = [upload_id for upload_id in pending if upload_id not in self._scheduled]
+        for upload_id in resumed:
+            self.enqueue(upload_id)
+        if resumed:
+            logger.info(f"Retomando {len(resumed)} uploads pendentes sem reserva ativa")
+        return len(resumed)
+
+    async def start(self):
+        """Inicia os workers e retoma o que ficou pendente antes de um restart"""
+        self.spool_dir.mkdir(parents=True, exist_ok=True)
+        self.queue = asyncio.Queue()
+        self._tasks = [asyncio.create_task(self._worker()) for _ in range(self.workers)]
+
+        # Os ainda reservados por um processo que caiu são recusados agora e voltam pela varredura
+        try:
+            pending = await run_in_threadpool(self._pending_upload_ids)
+        except Exception:
+            # Sem banco no startup: a varredura periódica retoma os pendentes depois
+            logger.exception("Erro ao buscar uploads pendentes do spool")
+            pending = []
+        for upload_id in pending:
+            self.enqueue(upload_id)
+        if pending:
+            logger.info(f"Retomando {len(pending)} uploads pendentes do spool")
+        self._tasks.append(asyncio.create_task(self._sweep_loop()))
+
+    async def stop(self):
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+        self._scheduled.clear()
+
+    async def _sweep_loop(self):
+        while True:
+            await asyncio.sleep(SPOOL_SWEEP_INTERVAL_SECONDS)
+            try:
+                await self.sweep()
+            except Exception:
+                logger.exception("Erro na varredura de uploads pendentes do spool")
+
+    async def _worker(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            upload_id = await self.queue.get()
+            retry_in = None
+            try:
+                retry_in = await run_in_drive_pool(push_spooled_upload, upload_id)
+                if retry_in is not None:
+                    loop.call_later(retry_in, self.enqueue, upload_id)
+            except Exception:
+                logger.exception(f"Erro inesperado ao enviar upload {upload_id} do spool")
+            finally:
+                if retry_in is None:
+                    self._scheduled.discard(upload_id)
+                self.queue.task_done()
+
+upload_spool = UploadSpool()
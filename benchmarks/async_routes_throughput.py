@@ -0,0 +1,115 @@
+#!/usr/bin/env python3
+"""
+Benchmark: vazão das rotas de leitura com uploads simultâneos em andamento
+
+Mantém BENCH_READERS clientes lendo sem pausa as rotas mais acessadas (álbuns do cliente,
+estatísticas do dashboard, cores do site e listagem de uploads) enquanto
+BENCH_UPLOAD_CONCURRENCY uploads contínuos ocupam o backend. Rodar antes e depois de uma
+mudança, com o mesmo número de workers do uvicorn (BENCH_WORKERS só entra no relatório),
+para comparar requisições por segundo e p95 por rota.
+
+Uso:
+    BENCH_ALBUM_ID=<álbum ativo> BENCH_CLIENT_ID=<dono do álbum> BENCH_WORKERS=4 \\
+        python benchmarks/async_routes_throughput.py
+"""
+
+import os
+import threading
+import time
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+
+BACKEND_URL = os.environ.get('REACT_APP_BACKEND_URL', 'http://localhost:8001')
+API_BASE = f"{BACKEND_URL}/api"
+
+ALBUM_ID = os.environ.get('BENCH_ALBUM_ID')
+CLIENT_ID = os.environ.get('BENCH_CLIENT_ID')
+WORKERS = int(os.environ.get('BENCH_WORKERS', 1))
+READERS = int(os.environ.get('BENCH_READERS', 32))
+UPLOAD_CONCURRENCY = int(os.environ.get('BENCH_UPLOAD_CONCURRENCY', 10))
+UPLOAD_SIZE_MB = int(os.environ.get('BENCH_UPLOAD_SIZE_MB', 5))
+DURATION_SECONDS = int(os.environ.get('BENCH_DURATION_SECONDS', 30))
+
+def percentile(samples, pct):
+    ordered = sorted(samples)
+    index = min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))
+    return ordered[index]
+
+def read_routes():
+    return {
+        'albums': f"{API_BASE}/clients/{CLIENT_ID}/albums",
+        'dashboard-stats': f"{API_BASE}/admin/dashboard-stats",
+        'site-colors': f"{API_BASE}/admin/site-colors",
+        'uploads': f"{API_BASE}/uploads/{ALBUM_ID}?limit=50",
+    }
+
+def upload_loop(stop, payload, results):
+    session = requests.Session()
+    while not stop.is_set():
+        try:
+            response = session.post(
+                f"{API_BASE}/albums/{ALBUM_ID}/upload",
+                files={'file': ('bench.bin', payload, 'application/octet-stream')},
+                data={'guest_name': 'Benchmark'},
+                timeout=600
+            )
+            results.append(response.status_code)
+        except requests.RequestException:
+            results.append(None)
+
+def read_loop(stop, routes, offset, latencies, errors):
+    session = requests.Session()
+    names = list(routes)
+    turn = offset
+    while not stop.is_set():
+        name = names[turn % len(names)]
+        turn += 1
+        started = time.perf_counter()
+        try:
+            response = session.get(routes[name], timeout=60)
+            if response.status_code >= 400:
+                errors[name] += 1
+                continue
+        except requests.RequestException:
+            errors[name] += 1
+            continue
+        latencies[name].append((time.perf_counter() - started) * 1000)
+
+def main():
+    if not ALBUM_ID or not CLIENT_ID:
+        raise SystemExit("Defina BENCH_ALBUM_ID e BENCH_CLIENT_ID (álbum ativo e seu cliente)")
+
+    routes = read_routes()
+    payload = os.urandom(UPLOAD_SIZE_MB * 1024 * 1024)
+    stop = threading.Event()
+    latencies, errors, uploads = defaultdict(list), defaultdict(int), []
+
+    print(f"🧪 {READERS} leitores + {UPLOAD_CONCURRENCY} uploads de {UPLOAD_SIZE_MB} MB por {DURATION_SECONDS}s "
+          f"({WORKERS} worker(s))")
+    with ThreadPoolExecutor(max_workers=READERS + UPLOAD_CONCURRENCY) as pool:
+        for _ in range(UPLOAD_CONCURRENCY):
+            pool.submit(upload_loop, stop, payload, uploads)
+        for offset in range(READERS):
+            pool.submit(read_loop, stop, routes, offset, latencies, errors)
+        time.sleep(DURATION_SECONDS)
+        stop.set()
+
+    print("=" * 60)
+    total = 0
+    for name in routes:
+        samples = latencies[name]
+        total += len(samples)
+        if not samples:
+            print(f"{name:>16}: nenhuma leitura concluída (erros: {errors[name]})")
+            continue
+        print(f"{name:>16}: {len(samples) / DURATION_SECONDS:8.1f} req/s  "
+              f"p50 {percentile(samples, 50):6.1f} ms  p95 {percentile(samples, 95):6.1f} ms  "
+              f"(erros: {errors[name]})")
+    print(f"{'total':>16}: {total / DURATION_SECONDS:8.1f} req/s  ({total / DURATION_SECONDS / WORKERS:.1f} por worker)")
+    ok_uploads = [status for status in uploads if status and status < 400]
+    print(f"Uploads concluídos: {len(ok_uploads)} de {len(uploads)}")
+
+if __name__ == "__main__":
+    main()
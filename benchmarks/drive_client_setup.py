@@ -0,0 +1,47 @@
+#!/usr/bin/env python3
+"""
+Microbenchmark: custo de montar o cliente do Drive a cada upload
+
+Compara build('drive', 'v3') por upload (comportamento antigo) com o cache de
+clientes por thread de google_drive_service.get_drive_client. Não acessa a rede.
+
+Uso:
+    python benchmarks/drive_client_setup.py
+"""
+
+import os
+import statistics
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / 'backend'))
+
+from google.oauth2.credentials import Credentials
+from googleapiclient.discovery import build
+
+from google_drive_service import get_drive_client
+
+ITERATIONS = int(os.environ.get('BENCH_ITERATIONS', 200))
+
+def measure(label, setup):
+    samples = []
+    for _ in range(ITERATIONS):
+        started = time.perf_counter()
+        setup()
+        samples.append((time.perf_counter() - started) * 1000)
+    print(f"{label:<32} média: {statistics.mean(samples):8.3f} ms   p99: {sorted(samples)[int(len(samples) * 0.99) - 1]:8.3f} ms")
+    return statistics.mean(samples)
+
+def main():
+    credentials = Credentials(token='benchmark-token')
+
+    print(f"🧪 Montagem do cliente do Drive ({ITERATIONS} iterações)")
+    print("=" * 70)
+    before = measure("build() a cada upload", lambda: build('drive', 'v3', credentials=credentials))
+    after = measure("get_drive_client() em cache", lambda: get_drive_client('benchmark-client', credentials))
+    print("=" * 70)
+    print(f"Ganho por upload: {before - after:.3f} ms ({before / after:.0f}x)")
+
+if __name__ == "__main__":
+    main()
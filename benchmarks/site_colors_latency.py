@@ -0,0 +1,92 @@
+#!/usr/bin/env python3
+"""
+Benchmark: latência de GET /api/admin/site-colors com uploads simultâneos em andamento
+
+Dispara UPLOAD_CONCURRENCY uploads contínuos para um álbum ativo e, ao mesmo tempo,
+mede a latência das leituras de cores do site. Rodar contra o backend antes e depois
+de uma mudança para comparar p50/p95/p99.
+
+Uso:
+    BENCH_ALBUM_ID=<album ativo> python benchmarks/site_colors_latency.py
+"""
+
+import os
+import statistics
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+
+BACKEND_URL = os.environ.get('REACT_APP_BACKEND_URL', 'http://localhost:8001')
+API_BASE = f"{BACKEND_URL}/api"
+
+ALBUM_ID = os.environ.get('BENCH_ALBUM_ID')
+UPLOAD_CONCURRENCY = int(os.environ.get('BENCH_UPLOAD_CONCURRENCY', 20))
+UPLOAD_SIZE_MB = int(os.environ.get('BENCH_UPLOAD_SIZE_MB', 20))
+DURATION_SECONDS = int(os.environ.get('BENCH_DURATION_SECONDS', 30))
+READ_INTERVAL = float(os.environ.get('BENCH_READ_INTERVAL', 0.05))
+
+def percentile(samples, pct):
+    ordered = sorted(samples)
+    index = min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))
+    return ordered[index]
+
+def upload_loop(stop, payload, results):
+    session = requests.Session()
+    while not stop.is_set():
+        started = time.perf_counter()
+        try:
+            response = session.post(
+                f"{API_BASE}/albums/{ALBUM_ID}/upload",
+                files={'file': ('bench.bin', payload, 'application/octet-stream')},
+                data={'guest_name': 'Benchmark'},
+                timeout=600
+            )
+            results.append((response.status_code, time.perf_counter() - started))
+        except requests.RequestException:
+            results.append((None, time.perf_counter() - started))
+
+def read_loop(stop, latencies, errors):
+    session = requests.Session()
+    while not stop.is_set():
+        started = time.perf_counter()
+        try:
+            response = session.get(f"{API_BASE}/admin/site-colors", timeout=60)
+            if response.status_code >= 400:
+                errors.append(response.status_code)
+        except requests.RequestException as e:
+            errors.append(str(e))
+        latencies.append((time.perf_counter() - started) * 1000)
+        time.sleep(READ_INTERVAL)
+
+def main():
+    if not ALBUM_ID:
+        raise SystemExit("Defina BENCH_ALBUM_ID com o ID de um álbum ativo")
+
+    payload = os.urandom(UPLOAD_SIZE_MB * 1024 * 1024)
+    stop = threading.Event()
+    latencies, errors, uploads = [], [], []
+
+    print(f"🧪 {UPLOAD_CONCURRENCY} uploads de {UPLOAD_SIZE_MB} MB em paralelo por {DURATION_SECONDS}s")
+    with ThreadPoolExecutor(max_workers=UPLOAD_CONCURRENCY + 1) as pool:
+        for _ in range(UPLOAD_CONCURRENCY):
+            pool.submit(upload_loop, stop, payload, uploads)
+        pool.submit(read_loop, stop, latencies, errors)
+        time.sleep(DURATION_SECONDS)
+        stop.set()
+
+    if not latencies:
+        raise SystemExit("Nenhuma leitura de site-colors concluída")
+
+    print("=" * 50)
+    print(f"Leituras de site-colors: {len(latencies)} (erros: {len(errors)})")
+    print(f"  p50: {percentile(latencies, 50):.1f} ms")
+    print(f"  p95: {percentile(latencies, 95):.1f} ms")
+    print(f"  p99: {percentile(latencies, 99):.1f} ms")
+    print(f"  máx: {max(latencies):.1f} ms  média: {statistics.mean(latencies):.1f} ms")
+    ok_uploads = [elapsed for status, elapsed in uploads if status and status < 400]
+    print(f"Uploads concluídos: {len(ok_uploads)} de {len(uploads)}")
+
+if __name__ == "__main__":
+    main()
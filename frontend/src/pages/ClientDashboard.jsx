@@ -127,33 +127,20 @@ const ClientDashboard = () => {
     try {
       setLoading(true);
       const backendUrl = process.env.REACT_APP_BACKEND_URL || 'http://localhost:8001';
-      const response = await fetch(`${backendUrl}/api/clients/${clientId}`);
+      // Cliente, álbuns, Google Drive e notificações numa única requisição
+      const response = await fetch(`${backendUrl}/api/clients/${clientId}/dashboard`);
       
       if (response.ok) {
-        const clientData = await response.json();
-        
-        // Verificar se tem Google token ativo
-        const tokenResponse = await fetch(`${backendUrl}/api/clients/${clientId}/google-status`);
-        let googleDriveConnected = false;
-        let googleAccount = null;
-        
-        if (tokenResponse.ok) {
-          const tokenData = await tokenResponse.json();
-          googleDriveConnected = tokenData.connected;
-          googleAccount = tokenData.email;
-        }
-        
-        // Buscar álbuns do cliente
-        const albumsResponse = await fetch(`${backendUrl}/api/clients/${clientId}/albums`);
-        let albums = [];
-        if (albumsResponse.ok) {
-          albums = await albumsResponse.json();
-        }
+        const { client: clientData, albums, google, unread_notifications } = await response.json();
         
         setRealClient({
           ...clientData,
-          googleDriveConnected,
-          googleAccount,
+          googleDriveConnected: google.connected,
+          googleAccount: google.email,
+          notifications: unread_notifications.map(notification => ({
+            ...notification,
+            date: new Date(notification.created_at).toLocaleDateString('pt-BR')
+          })),
           albums: albums.map(album => ({
             ...album,
             id: album.id,